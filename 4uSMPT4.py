@@ -1,17 +1,20 @@
 
 import streamlit as st
 import random
-import itertools
-import matplotlib.pyplot as plt
-from PIL import Image
 import os
 import pandas as pd
 from best20_prefs import BEST_PREFS
+from smp_altair import matching_chart, show_chart
+from smp_core import PreferenceProfile
+from smp_render import FORMATS, FigureBudget, draw_matching_grid, show_figure, show_memory_report
+from smp_streamlit import (analysis, chart, figure, lattice_dot, optimal_matchings, preload_icons,
+                           profile_key, show_cache_stats)
 
 # -------------------- 基本設定 -------------------- #
 MEN = ["A", "B", "C", "D"]
 WOMEN = ["X", "Y", "Z", "W"]
 IMAGE_DIR = "img"
+preload_icons(IMAGE_DIR)
 
 # Streamlit >=1.32 では当オプション削除済み
 try:
@@ -55,68 +58,10 @@ if st.sidebar.button("好みをランダム初期化"):
 if 'men_prefs' not in st.session_state:
     st.session_state.men_prefs, st.session_state.women_prefs = BEST_PREFS[preset_keys[0]]
 
-# -------------------- 安定性判定 -------------------- #
-def is_stable(matching, men_prefs, women_prefs):
-    man2woman = {m: w for m, w in matching}
-    woman2man = {w: m for m, w in matching}
-    # 男性主導のブロッキングペア確認
-    for m, w in matching:
-        for w2 in men_prefs[m][:men_prefs[m].index(w)]:
-            if women_prefs[w2].index(m) < women_prefs[w2].index(woman2man[w2]):
-                return False
-    # 女性主導のブロッキングペア確認
-    for w, m in woman2man.items():
-        for m2 in women_prefs[w][:women_prefs[w].index(m)]:
-            if men_prefs[m2].index(w) < men_prefs[m2].index(man2woman[m2]):
-                return False
-    return True
-
-def all_stable_matchings(men_prefs, women_prefs):
-    stable = []
-    for perm in itertools.permutations(WOMEN):
-        mlist = list(zip(MEN, perm))
-        if is_stable(mlist, men_prefs, women_prefs):
-            stable.append(mlist)
-    return stable
-
-# -------------------- 満足度計算 -------------------- #
-def calculate_dissatisfaction(matching, men_prefs, women_prefs):
-    man_score = sum(men_prefs[m].index(w) for m, w in matching)
-    woman_score = sum(women_prefs[w].index(m) for m, w in matching)
-    total = man_score + woman_score
-    diff = abs(man_score - woman_score)
-    max_score = max(max(men_prefs[m].index(w), women_prefs[w].index(m)) for m, w in matching)
-    return total, man_score, woman_score, diff, max_score
-
-# -------------------- マッチング図描画 -------------------- #
-def draw_matching_with_images(matching, men_prefs, women_prefs):
-    fig, ax = plt.subplots(figsize=(6, 2.4), dpi=800)
-    ax.axis('off')
-    spacing = 0.3
-    x_men, x_women = 0.2, 0.8
-    icon_w, icon_h = 45, 36
-    hoff = icon_h * 0.5 / icon_w * 0.25
-    woff = 0.10
-    for m, w in matching:
-        y_m = -MEN.index(m) * spacing
-        y_w = -WOMEN.index(w) * spacing
-        ax.plot([x_men, x_women], [y_m, y_w], 'k-', lw=1.2, zorder=1)
-        pm = os.path.join(IMAGE_DIR, f"{m}.png")
-        if os.path.exists(pm):
-            img = Image.open(pm).resize((icon_w, icon_h), Image.LANCZOS)
-            ax.imshow(img, extent=(x_men-woff, x_men+woff, y_m-hoff, y_m+hoff), zorder=2)
-        satisfaction_m = 3 - men_prefs[m].index(w)
-        ax.text(x_men-woff-0.02, y_m, f"({satisfaction_m}) {m}", va='center', ha='right', fontsize=10, zorder=3)
-        pw = os.path.join(IMAGE_DIR, f"{w}.png")
-        if os.path.exists(pw):
-            img = Image.open(pw).resize((icon_w, icon_h), Image.LANCZOS)
-            ax.imshow(img, extent=(x_women-woff, x_women+woff, y_w-hoff, y_w+hoff), zorder=2)
-        satisfaction_w = 3 - women_prefs[w].index(m)
-        ax.text(x_women+woff+0.02, y_w, f"({satisfaction_w}) {w}", va='center', ha='left', fontsize=10, zorder=3)
-    ax.set_xlim(0, 1)
-    ax.set_ylim(- (len(MEN) - 1) * spacing - 0.3, 0.3)
-    plt.subplots_adjust(top=1, bottom=0, left=0, right=1, hspace=0)
-    return fig
+# 図の形式（アイコン入りの図は WebP が最も軽い．vega はブラウザで描き，人にマウスを
+# 乗せると好みの順が出る）と 1 ページあたりの送信量の目安
+figure_format = st.sidebar.selectbox("図の形式", FORMATS + ("vega",), index=FORMATS.index("webp"))
+budget = FigureBudget(limit=1024 * 1024)
 
 # -------------------- 現在の好み表示 -------------------- #
 st.subheader("現在の好み")
@@ -153,7 +98,11 @@ with col2:
 st.markdown('<a name="allM"></a>', unsafe_allow_html=True)
 st.markdown("---")
 st.subheader("安定マッチング一覧")
-matchings = all_stable_matchings(st.session_state.men_prefs, st.session_state.women_prefs)
+profile = PreferenceProfile(st.session_state.men_prefs, st.session_state.women_prefs)
+# 一覧と指標・束・最適マッチング・図は全セッション共通のキャッシュから取る（同じ好みなら計算しない）
+key = profile_key(st.session_state.men_prefs, st.session_state.women_prefs)
+matchings, satisfaction = analysis(key)
+st.caption(f"この好みでは安定マッチングは {len(matchings)} 個")
 results = []
 roman_labels = ['(i)', '(ii)', '(iii)', '(iv)', '(v)', '(vi)', '(vii)', '(viii)', '(ix)', '(x)']
 
@@ -165,12 +114,7 @@ for i in range(0, len(matchings), 2):
         mlist = matchings[i + j]
 
         # ----- 満足度計算 ----- #
-        total, ms, ws, diff, maxd = calculate_dissatisfaction(mlist, st.session_state.men_prefs, st.session_state.women_prefs)
-        total_satis = 3 * 2 * len(mlist) - total
-        ms_satis = 3 * len(mlist) - ms
-        ws_satis = 3 * len(mlist) - ws
-        diff_satis = abs(ms_satis - ws_satis)
-        max_satis = 3 - maxd
+        total_satis, ms_satis, ws_satis, diff_satis, max_satis = satisfaction[i + j]
         results.append([total_satis, ms_satis, ws_satis, diff_satis, max_satis])
 
         # ----- 表示 ----- #
@@ -181,7 +125,37 @@ for i in range(0, len(matchings), 2):
             st.markdown(
                 f"**{', '.join([f'{m}→{w}' for m, w in mlist])}**",
                 unsafe_allow_html=True)
-            st.pyplot(draw_matching_with_images(mlist, st.session_state.men_prefs, st.session_state.women_prefs))
+            if figure_format == "vega":
+                spec = chart("4uSMPT4.chart", key, mlist,
+                             lambda m, mp, wp: matching_chart(m, MEN, WOMEN, mp, wp))
+                show_chart(spec, budget, roman_labels[i + j])
+
+# ----- 全マッチングの図を 1 枚にまとめて描く（アイコンの背景は共通，書き出しも 1 回） ----- #
+if matchings and figure_format != "vega":
+    data = figure("4uSMPT4.grid", key, matchings,
+                  lambda ms, mp, wp: draw_matching_grid(ms, MEN, WOMEN, mp, wp, titles=roman_labels[:len(ms)]),
+                  figure_format, 700)
+    show_figure(data, figure_format, budget, "一覧")
+
+# ----- 安定マッチングの束（上ほど男性に有利，矢印は 1 つのローテーション除去） ----- #
+with st.expander("安定マッチングの束（Hasse 図）"):
+    st.graphviz_chart(lattice_dot(key, roman_labels[:len(matchings)]))
+
+# ----- 自分で組んだマッチングの安定性チェック（ブロッキングペアを全部表示） ----- #
+with st.expander("自分で組んだマッチングを確認"):
+    check_cols = st.columns(len(MEN))
+    chosen = []
+    for c, m in zip(check_cols, MEN):
+        with c:
+            chosen.append((m, st.selectbox(f"{m} の相手", WOMEN, index=MEN.index(m), key=f"check_{m}")))
+    if len({w for _, w in chosen}) < len(WOMEN):
+        st.warning("同じ女性が複数の男性に選ばれています")
+    else:
+        blocking = profile.blocking_pairs(chosen)
+        if blocking:
+            st.markdown("**不安定**　ブロッキングペア：" + ", ".join(f"{m}–{w}" for m, w in blocking))
+        else:
+            st.markdown("**安定マッチングです**")
 
 # -------------------- 結果表作成 -------------------- #
 df = pd.DataFrame(results, columns=["満足度合計", "男性和", "女性和", "差", "最小"], index=roman_labels[:len(matchings)])
@@ -228,6 +202,18 @@ st.markdown("### 5つの指標での安定マッチングの比較")
 #st.markdown("### <div id="idx">5つの指標での安定マッチングの比較</div>")
 styled_df = df.style.apply(highlight_special, axis=None)
 st.dataframe(styled_df, use_container_width=True)
+
+# ----- 列挙を使わずに求めた最適マッチング（表の赤字と一致する） ----- #
+def format_pairs(pairs):
+    return ', '.join(f'{m}→{w}' for m, w in pairs)
+
+optimal = optimal_matchings(key, time_limit=1.0)
+best_total, best_total_value = optimal["total"]
+st.markdown(f"- 満足度合計 最大 {best_total_value}：{format_pairs(best_total)}")
+best_min, best_min_value = optimal["min"]
+st.markdown(f"- 最小 最大 {best_min_value}：{format_pairs(best_min)}")
+best_equal, best_equal_value, gap = optimal["equal"]
+st.markdown(f"- 差 最小 {best_equal_value}：{format_pairs(best_equal)}" + (f"（時間切れ，最適値との差は最大 {gap}）" if gap else ""))
 st.markdown("""
 - 満足度合計最大化：全員の満足度が全体として向上，一部のメンバーにだけ満足度が低くなる可能性がある
 - 一方のグループの満足度合計の最大化：マッチンググループが対等の場合，もう一方のグループからの不満がでる
@@ -236,6 +222,9 @@ st.markdown("""
 st.markdown("""→　適用する問題に合わせて選択，数理的手法で求解
 """)
 st.markdown("---")
+show_cache_stats()
+budget.report()
+show_memory_report()
 
 # -------------------- ソースダウンロード -------------------- #
 # 実行ファイル自身を読み取り専用モードで開き、ダウンロードボタンを提供
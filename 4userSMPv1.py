@@ -1,9 +1,9 @@
 ﻿import streamlit as st
 import random
-import matplotlib.pyplot as plt
-from PIL import Image
-import os
 from best20_prefs import BEST_PREFS
+from smp_assets import icon
+from smp_render import show_pyplot, subplots
+from smp_streamlit import gs_trace, preload_icons, profile_key
 
 # 定数
 MEN = ["A", "B", "C", "D"]
@@ -11,6 +11,7 @@ WOMEN = ["X", "Y", "Z", "W"]
 IMAGE_DIR = "img"
 
 st.set_page_config(layout="wide")
+preload_icons(IMAGE_DIR)
 st.title("安定結婚問題 - GS法（女性からの提案）段階シミュレーション")
 
 # プリセット呼び出し
@@ -19,10 +20,6 @@ choice = st.sidebar.selectbox("好みパターン番号を選択", preset_keys)
 if st.sidebar.button("このパターンで初期化"):
     st.session_state.men_prefs, st.session_state.women_prefs = BEST_PREFS[choice]
     st.session_state.step = 0
-    st.session_state.proposals = {w: [] for w in WOMEN}
-    st.session_state.engaged = {}
-    st.session_state.free_women = WOMEN[:]
-    st.session_state.received = {m: [] for m in MEN}
 
 # ランダム初期化
 if st.sidebar.button("好みをランダム初期化"):
@@ -32,30 +29,14 @@ if st.sidebar.button("好みをランダム初期化"):
         return men, women
     st.session_state.men_prefs, st.session_state.women_prefs = generate_random_prefs()
     st.session_state.step = 0
-    st.session_state.proposals = {w: [] for w in WOMEN}
-    st.session_state.engaged = {}
-    st.session_state.free_women = WOMEN[:]
-    st.session_state.received = {m: [] for m in MEN}
 
 # セッションステート初期化
 if 'men_prefs' not in st.session_state:
     st.session_state.men_prefs, st.session_state.women_prefs = BEST_PREFS[preset_keys[0]]
     st.session_state.step = 0
-    st.session_state.proposals = {w: [] for w in WOMEN}
-    st.session_state.engaged = {}
-    st.session_state.free_women = WOMEN[:]
-    st.session_state.received = {m: [] for m in MEN}
-
-def calculate_dissatisfaction(matching, men_prefs, women_prefs):
-    man_score = sum(men_prefs[m].index(w) for m, w in matching)
-    woman_score = sum(women_prefs[w].index(m) for m, w in matching)
-    total = man_score + woman_score
-    diff = abs(man_score - woman_score)
-    max_score = max(max(men_prefs[m].index(w), women_prefs[w].index(m)) for m, w in matching)
-    return total, man_score, woman_score, diff, max_score
 
 def draw_state_with_proposals(matching, proposals, men_prefs, women_prefs):
-    fig, ax = plt.subplots(figsize=(3, 1.2), dpi=300)
+    fig, ax = subplots(figsize=(3, 1.2), dpi=300)
     ax.axis('off')
     spacing = 0.25
     x_men, x_women = 0.2, 0.8
@@ -65,16 +46,14 @@ def draw_state_with_proposals(matching, proposals, men_prefs, women_prefs):
 
     for i, m in enumerate(MEN):
         y = -i * spacing
-        pm = os.path.join(IMAGE_DIR, f"{m}.png")
-        if os.path.exists(pm):
-            img = Image.open(pm).resize((icon_w, icon_h), Image.LANCZOS)
+        img = icon(m, (icon_w, icon_h), IMAGE_DIR)
+        if img is not None:
             ax.imshow(img, extent=(x_men-woff, x_men+woff, y-hoff, y+hoff))
         ax.text(x_men-woff-0.015, y, m, va='center', ha='right', fontsize=8)
     for i, w in enumerate(WOMEN):
         y = -i * spacing
-        pw = os.path.join(IMAGE_DIR, f"{w}.png")
-        if os.path.exists(pw):
-            img = Image.open(pw).resize((icon_w, icon_h), Image.LANCZOS)
+        img = icon(w, (icon_w, icon_h), IMAGE_DIR)
+        if img is not None:
             ax.imshow(img, extent=(x_women-woff, x_women+woff, y-hoff, y+hoff))
         ax.text(x_women+woff+0.015, y, w, va='center', ha='left', fontsize=8)
 
@@ -92,51 +71,55 @@ def draw_state_with_proposals(matching, proposals, men_prefs, women_prefs):
 
     ax.set_xlim(0,1)
     ax.set_ylim(- (len(MEN)-1) * spacing - 0.2, 0.2)
-    plt.subplots_adjust(top=1,bottom=0,left=0,right=1,hspace=0)
+    fig.subplots_adjust(top=1,bottom=0,left=0,right=1,hspace=0)
     return fig
 
-def gs_step():
-    if not st.session_state.free_women:
-        return
-
-    w = st.session_state.free_women[0]
-    prefs = st.session_state.women_prefs[w]
-
-    for m in prefs:
-        if m not in st.session_state.proposals[w]:
-            st.session_state.proposals[w].append(m)
-            st.session_state.received[m].append(w)
-
-            if m not in st.session_state.engaged:
-                st.session_state.engaged[m] = w
-                st.session_state.free_women.pop(0)
-            else:
-                current_w = st.session_state.engaged[m]
-                men_prefs = st.session_state.men_prefs[m]
-                if men_prefs.index(w) < men_prefs.index(current_w):
-                    st.session_state.engaged[m] = w
-                    st.session_state.free_women.pop(0)
-                    st.session_state.free_women.append(current_w)
-            break
-
-st.button("次のステップ", on_click=gs_step)
+# -------------------- 受入保留の記録と再生 -------------------- #
+# 好み 1 組につき最後まで 1 回だけ走らせて記録し（smp_trace），表示する手の状態を作り直す
+key = profile_key(st.session_state.men_prefs, st.session_state.women_prefs)
+trace = gs_trace(key, women_propose=True)
+men = list(st.session_state.men_prefs)
+women = list(st.session_state.women_prefs)
+
+def move_step(delta):
+    st.session_state.step = max(0, min(st.session_state.step + delta, len(trace)))
+
+step_cols = st.columns([1, 1, 6])
+step_cols[0].button("前のステップ", on_click=move_step, args=(-1,))
+step_cols[1].button("次のステップ", on_click=move_step, args=(1,))
+st.slider("ステップ", 0, len(trace), key="step")
+
+state = trace.state(st.session_state.step)
+engaged = {men[j]: women[i] for j, i in enumerate(state.holder) if i >= 0}
+proposals = {w: st.session_state.women_prefs[w][:state.nxt[k]] for k, w in enumerate(women)}
+received = {m: [women[i] for i in state.received[j]] for j, m in enumerate(men)}
+if state.last is not None:
+    i, j, accepted, displaced = state.last
+    if not accepted:
+        st.caption(f"{state.step} 手目: {women[i]} → {men[j]}（断られる）")
+    elif displaced >= 0:
+        st.caption(f"{state.step} 手目: {women[i]} → {men[j]}（受理，{women[displaced]} は振られる）")
+    else:
+        st.caption(f"{state.step} 手目: {women[i]} → {men[j]}（受理）")
+if state.done:
+    st.caption("全員の相手が決まりました")
 
 st.markdown("### 各男性の現在の婚約者")
 for m in MEN:
-    if m in st.session_state.engaged:
-        st.markdown(f"{m} ❤️ {st.session_state.engaged[m]}")
+    if m in engaged:
+        st.markdown(f"{m} ❤️ {engaged[m]}")
     else:
         st.markdown(f"{m} ❤️ （未婚）")
 
 st.markdown("### 各男性への告白者")
 for m in MEN:
-    received_list = st.session_state.received[m]
+    received_list = received[m]
     if received_list:
         st.markdown(f"{m} ⇦ 告白者: {', '.join(received_list)}")
     else:
         st.markdown(f"{m} ⇦ 告白者なし")
 
 st.markdown("### 現在の状態（図示）")
-current_matching = [(m, w) for m, w in st.session_state.engaged.items()]
-fig = draw_state_with_proposals(current_matching, st.session_state.proposals, st.session_state.men_prefs, st.session_state.women_prefs)
-st.pyplot(fig)
+current_matching = [(m, w) for m, w in engaged.items()]
+fig = draw_state_with_proposals(current_matching, proposals, st.session_state.men_prefs, st.session_state.women_prefs)
+show_pyplot(fig)
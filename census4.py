@@ -0,0 +1,286 @@
+# 4×4 の好みパターンの全数調査（同型なものは 1 つにまとめる）
+#
+# 生の 4×4 パターンは 24^8 ≈ 1.1×10^11 通りあるが，男性・女性の名前の付け替え (4!×4!) と
+# 男女の入れ替え (×2) でまとめると約 10^8 個の同型類（軌道）になる．各軌道の代表
+# （smp_canon の標準形）について，安定マッチングの個数と 5 つの指標の最適値を
+# 1 個 32 ビットに詰めてメモリマップしたファイルに書き込む．
+#
+#   python census4.py --out census4 --workers 4      # 途中で止めても同じコマンドで再開
+#   python census4.py --out census4 --summary        # 個数ごとの軌道数・パターン数
+#
+# ファイルの並び: 標準形では男性 0 の好みが (0, 1, 2, 3)，男性 1〜3 の好みは辞書順に
+# 並んでいる．そこで「男性の好みの組 R（有効なものだけ番号を振る）」× 「女性の好みの
+# 組 c（24^4 通り）」を番地にする．1 つの R が 1 つの仕事で，終わったものは
+# <out>.done に記録するので，中断しても終わっていない R からやり直せる．
+
+import argparse
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from smp_canon import canonical_form
+
+N = 4
+PERMS = list(itertools.permutations(range(N)))
+PERM_RANK = {p: k for k, p in enumerate(PERMS)}
+P = len(PERMS)                  # 24
+COLS = P ** N                   # 女性側の好みの組の数 (331776)
+GROUP_ORDER = 2 * P * P         # 1152
+RAW_TOTAL = P ** (2 * N)        # 24^8
+
+# 1 個分の 32 ビットの中身（count = 0 はまだ調べていない番地）
+FIELDS = (                      # (名前, 先頭ビット, ビット数)
+    ("count", 0, 4),            # 安定マッチングの個数 (1..10)
+    ("total", 4, 5),            # 満足度合計 最大 (0..24)
+    ("men", 9, 4),              # 男性和 最大 (0..12)
+    ("women", 13, 4),           # 女性和 最大 (0..12)
+    ("diff", 17, 4),            # 差 最小 (0..12)
+    ("min", 21, 2),             # 最小 最大 (0..3)
+)
+
+# COMPOSE[s][p]: 順列 p の各要素を順列 s で付け替えたものの番号
+COMPOSE = np.array([[PERM_RANK[tuple(s[x] for x in p)] for p in PERMS] for s in PERMS], dtype=np.int64)
+PERM_ARRAY = np.array(PERMS, dtype=np.int64)
+INV_ARRAY = np.argsort(PERM_ARRAY, axis=1)          # INV_ARRAY[k][x] = 順列 k の中での x の位置（= 順位）
+WEIGHTS = P ** np.arange(N - 1, -1, -1)             # 4 桁の 24 進数（辞書順と一致）
+
+
+def _code(ranks):
+    return sum(int(r) * int(w) for r, w in zip(ranks, WEIGHTS))
+
+
+def _apply(g_men, g_women, ranks):
+    # 男性側の好み ranks（人ごとの順列番号）を 付け替え (g_men, g_women) で写した順列番号の列
+    out = [0] * N
+    for i, r in enumerate(ranks):
+        out[g_men[i]] = COMPOSE[g_women][r]
+    return out
+
+
+def row_sets():
+    """
+    有効な男性側の好みの組 R（男性 0 が恒等順列，男性 1〜3 が昇順で，
+    名前の付け替えでこれより辞書順に小さくならないもの）のリスト．
+    """
+    valid = []
+    for rest in itertools.combinations_with_replacement(range(P), N - 1):
+        ranks = (0,) + rest
+        code = _code(ranks)
+        if all(_code(_apply(s, t, ranks)) >= code for s in PERMS for t in range(P)):
+            valid.append(ranks)
+    return valid
+
+
+ROW_SETS = None
+ROW_INDEX = None
+
+
+def _row_sets():
+    global ROW_SETS, ROW_INDEX
+    if ROW_SETS is None:
+        ROW_SETS = row_sets()
+        ROW_INDEX = {r: k for k, r in enumerate(ROW_SETS)}
+    return ROW_SETS
+
+
+# -------------------- 1 つの R の処理 -------------------- #
+def _col_digits():
+    c = np.arange(COLS, dtype=np.int64)
+    return [(c // WEIGHTS[j]) % P for j in range(N)]
+
+
+def _canonical_mask(ranks, digits):
+    """
+    R = ranks の各番地が標準形かどうかと，その自己同型の個数を返す．
+    群の 1152 個の元それぞれについて，写した先 (rows', cols') が (R, c) より
+    辞書順で小さくならないことを全番地まとめて確かめる．
+    """
+    row_code = _code(ranks)
+    col_code = sum(d * w for d, w in zip(digits, WEIGHTS))
+    ok = np.ones(COLS, dtype=bool)
+    autos = np.zeros(COLS, dtype=np.int16)
+    for s in PERMS:
+        for t in range(P):
+            # 男女そのまま: rows' は c によらない
+            rows = _apply(s, t, ranks)
+            code = _code(rows)
+            if code == row_code:
+                image = np.zeros(COLS, dtype=np.int64)
+                for j in range(N):
+                    image += COMPOSE[PERM_RANK[s]][digits[j]] * WEIGHTS[PERMS[t][j]]
+                ok &= image >= col_code
+                autos += image == col_code
+            # 男女を入れ替え: rows' は c から，cols' は R から決まる
+            rows_sw = np.zeros(COLS, dtype=np.int64)
+            for j in range(N):
+                rows_sw += COMPOSE[t][digits[j]] * WEIGHTS[s[j]]
+            cols_sw = _code(_apply(PERMS[t], PERM_RANK[s], ranks))
+            equal = rows_sw == row_code
+            ok &= (rows_sw > row_code) | (equal & (cols_sw >= col_code))
+            autos += equal & (cols_sw == col_code)
+    return ok, autos
+
+
+def _stats(ranks, digits, chunk=16384):
+    """R = ranks の全番地について FIELDS の値を詰めた uint32 を返す"""
+    men_rank = INV_ARRAY[list(ranks)]                           # (4, 4) 男性 i にとっての女性 j の順位
+    wives, husbands = PERM_ARRAY, INV_ARRAY                     # 24 通りのマッチング
+    idx = np.arange(N)
+    own_m = men_rank[idx, wives]                                # (24, 4)
+    man_better = men_rank[None, :, :] < own_m[:, :, None]       # (24, 4, 4)
+    ms = own_m.sum(axis=1)
+    worst_m = own_m.max(axis=1)
+    top = N - 1
+    out = np.empty(COLS, dtype=np.uint32)
+    for start in range(0, COLS, chunk):
+        stop = min(start + chunk, COLS)
+        # women_rank[b, j, i] = 女性 j にとっての男性 i の順位
+        women_rank = np.stack([INV_ARRAY[d[start:stop]] for d in digits], axis=1)
+        own_w = women_rank[:, idx, husbands]                    # (B, 24, 4)
+        woman_better = women_rank.transpose(0, 2, 1)[:, None, :, :] < own_w[:, :, None, :]
+        stable = ~(man_better[None] & woman_better).any(axis=(2, 3))
+        ws = own_w.sum(axis=2)
+        worst = np.maximum(worst_m[None, :], own_w.max(axis=2))
+        big = 1 << 8
+        values = {
+            "count": stable.sum(axis=1),
+            "total": top * 2 * N - np.where(stable, ms[None, :] + ws, big).min(axis=1),
+            "men": top * N - np.where(stable, ms[None, :], big).min(axis=1),
+            "women": top * N - np.where(stable, ws, big).min(axis=1),
+            "diff": np.where(stable, np.abs(ms[None, :] - ws), big).min(axis=1),
+            "min": top - np.where(stable, worst, big).min(axis=1),
+        }
+        packed = np.zeros(stop - start, dtype=np.uint32)
+        for name, shift, _ in FIELDS:
+            packed |= values[name].astype(np.uint32) << shift
+        out[start:stop] = packed
+    return out
+
+
+def _job(args):
+    # R 1 つ分を計算してファイルに書き込み，(R の番号, 個数ごとの軌道数, パターン数) を返す
+    path, k = args
+    ranks = _row_sets()[k]
+    digits = _col_digits()
+    ok, autos = _canonical_mask(ranks, digits)
+    packed = _stats(ranks, digits)
+    packed[~ok] = 0
+    data = np.memmap(path, dtype=np.uint32, mode="r+", shape=(len(ROW_SETS), COLS))
+    data[k] = packed
+    data.flush()
+    del data
+    counts = (packed & 0xF).astype(np.int64)
+    orbits = np.bincount(counts[ok], minlength=16)
+    raw = np.bincount(counts[ok], weights=GROUP_ORDER // autos[ok].astype(np.int64), minlength=16)
+    return k, orbits, raw.astype(np.int64)
+
+
+# -------------------- 全体の実行（再開可能） -------------------- #
+def run(out, workers=1, limit=None):
+    """
+    未処理の R をすべて（limit があればその個数だけ）処理する．
+    <out>.u32 が本体，<out>.done が終わった R ごとの集計（1 行 1 つ）．
+    """
+    rows = _row_sets()
+    path = out + ".u32"
+    if not os.path.exists(path):
+        # 0 で埋まった（疎な）ファイルを作る
+        np.memmap(path, dtype=np.uint32, mode="w+", shape=(len(rows), COLS)).flush()
+    done = _load_done(out)
+    todo = [k for k in range(len(rows)) if k not in done]
+    if limit is not None:
+        todo = todo[:limit]
+    start = time.perf_counter()
+    jobs = [(path, k) for k in todo]
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    results = pool.map(_job, jobs) if pool else map(_job, jobs)
+    with open(out + ".done", "a", encoding="utf-8") as log:
+        for finished, (k, orbits, raw) in enumerate(results, start=1):
+            log.write(f"{k} {' '.join(map(str, orbits))} {' '.join(map(str, raw))}\n")
+            log.flush()
+            elapsed = time.perf_counter() - start
+            print(f"[{len(done) + finished}/{len(rows)}] R={rows[k]}  {elapsed:.0f} 秒", flush=True)
+    if pool:
+        pool.shutdown()
+
+
+def _load_done(out):
+    done = {}
+    if os.path.exists(out + ".done"):
+        with open(out + ".done", encoding="utf-8") as f:
+            for line in f:
+                values = list(map(int, line.split()))
+                done[values[0]] = (values[1:17], values[17:33])
+    return done
+
+
+def summary(out):
+    """
+    {個数: (軌道の数, 生のパターンの数)} と，調べ終わった R の割合を返す．
+    すべて終わっていればパターンの数の合計は 24^8 になる．
+    """
+    done = _load_done(out)
+    orbits = np.zeros(16, dtype=np.int64)
+    raw = np.zeros(16, dtype=np.int64)
+    for o, r in done.values():
+        orbits += o
+        raw += r
+    table = {c: (int(orbits[c]), int(raw[c])) for c in range(16) if orbits[c]}
+    return table, len(done) / len(_row_sets())
+
+
+# -------------------- 参照 -------------------- #
+class Census:
+    """
+    調べ終わったファイルから O(1) で引く．
+      census = Census("census4")
+      census.lookup(profile)  -> {"count": 5, "total": 17, ...}（未調査なら None）
+    """
+
+    def __init__(self, out):
+        rows = _row_sets()
+        self.data = np.memmap(out + ".u32", dtype=np.uint32, mode="r", shape=(len(rows), COLS))
+
+    def lookup(self, profile):
+        if profile.n != N:
+            raise ValueError(f"census4 は 4×4 専用 (n = {profile.n})")
+        (men, women), _, (swapped, _, _) = canonical_form(profile.men_pref, profile.women_pref)
+        ranks = tuple(PERM_RANK[p] for p in men)
+        k = ROW_INDEX[ranks]
+        c = _code([PERM_RANK[p] for p in women])
+        result = unpack(int(self.data[k, c]))
+        if result is not None and swapped:
+            # 標準形で男女を入れ替えていれば，男性側・女性側の値も入れ替えて返す
+            result["men"], result["women"] = result["women"], result["men"]
+        return result
+
+
+def unpack(value):
+    if value & 0xF == 0:
+        return None
+    return {name: (value >> shift) & ((1 << bits) - 1) for name, shift, bits in FIELDS}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="4×4 の好みパターンの全数調査（同型類ごと）")
+    parser.add_argument("--out", default="census4", help="出力ファイルの接頭辞")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--limit", type=int, default=None, help="今回処理する R の個数の上限")
+    parser.add_argument("--summary", action="store_true", help="集計だけ表示する")
+    args = parser.parse_args()
+
+    if not args.summary:
+        run(args.out, args.workers, args.limit)
+    table, progress = summary(args.out)
+    orbit_total = sum(o for o, _ in table.values())
+    raw_total = sum(r for _, r in table.values())
+    print(f"進捗 {progress:.1%}  軌道 {orbit_total}  パターン {raw_total} / {RAW_TOTAL}")
+    for c, (o, r) in sorted(table.items()):
+        print(f"count={c:2d}  軌道 {o:10d} ({o / max(orbit_total, 1):.4%})  パターン {r:14d} ({r / RAW_TOTAL:.6%})")
+
+
+if __name__ == "__main__":
+    main()
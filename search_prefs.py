@@ -0,0 +1,214 @@
+# 「面白い」好みパターンの探索（BEST_PREFS の生成）
+#
+# ランダムな好みから山登りを繰り返し，目的関数の値が高いパターンを集める．
+# 複数プロセスで独立に探索し，名前の付け替えだけで一致するパターンは 1 つにまとめて
+# best20_prefs.py と同じ形式のモジュールに書き出す．
+#
+#   python search_prefs.py --n 4 --objective count --top 20 --out best20_prefs.py
+#   python search_prefs.py --n 5 --objective disagreement --workers 8 --out best5_prefs.py
+#
+# 目的関数は OBJECTIVES の名前か "モジュール名:関数名"（PreferenceProfile を受け取り
+# 数値を返す関数．大きいほど良い）で指定する．
+
+import argparse
+import importlib
+import itertools
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from smp_canon import canonical_key
+from smp_core import PreferenceProfile
+from smp_solvers import egalitarian_matching, minimum_regret_matching, sex_equal_matching
+
+# アプリで使っている名前に合わせる（それ以外の人数は A, B, ... と ..., Y, Z）
+LABELS = {
+    4: (["A", "B", "C", "D"], ["X", "Y", "Z", "W"]),
+    5: (["A", "B", "C", "D", "E"], ["V", "W", "X", "Y", "Z"]),
+}
+
+
+def labels(n):
+    if n in LABELS:
+        return LABELS[n]
+    if n > 13:
+        raise ValueError(f"名前を付けられるのは n <= 13 まで (n = {n})")
+    letters = [chr(ord("A") + i) for i in range(26)]
+    return letters[:n], letters[26 - n:]
+
+
+# -------------------- 目的関数 -------------------- #
+def stable_count(profile):
+    """安定マッチングの個数"""
+    count, _ = profile.count_stable_matchings()
+    return count
+
+
+def metric_disagreement(profile):
+    """
+    5つの指標それぞれの最適を 1 つずつ含むには安定マッチングが最低何個要るか（1 〜 5）．
+    同点の最適が複数あればどれを選んでもよいので，指標ごとに最適な番号の集合で考える．
+    最適値はソルバで求め，各マッチングは順位和（rank_sums）で判定する（束は作らない）．
+    """
+    poset = profile.rotations()
+    men_rank, women_rank = profile.men_rank, profile.women_rank
+    ms, ws = poset.rank_sums(poset.ideal_of(egalitarian_matching(profile)))
+    best_sum = ms + ws
+    _, best_diff, _ = sex_equal_matching(profile)
+    regret_wives, best_min = minimum_regret_matching(profile)
+    worst_allowed = profile.n - 1 - best_min
+
+    def mask(ideal, ms, ws):
+        # ビット: 0 満足度合計, 1 男性和, 2 女性和, 3 差, 4 最小
+        # 男性和・女性和の最大はそれぞれ男性最適（ideal が空）・女性最適（全部）だけ
+        m = ((ms + ws == best_sum) | (len(ideal) == 0) << 1 | (len(ideal) == len(poset)) << 2
+             | (abs(ms - ws) == best_diff) << 3)
+        if m or ideal == regret_ideal:
+            # 最小の判定だけは O(n) かかるので，他の指標で最適なものと最小のソルバの解だけ調べる
+            # （それ以外で最小だけが最適なマッチングはソルバの解に含まれる）
+            wives = poset.matching_of(ideal)
+            worst = max((max(men_rank[i][j], women_rank[j][i]) for i, j in enumerate(wives)), default=0)
+            m |= (worst == worst_allowed) << 4
+        return m
+
+    regret_ideal = poset.ideal_of(regret_wives)
+    masks = {mask(ideal, *poset.rank_sums(ideal)) for ideal in poset.iter_ideals()}
+    masks.discard(0)
+    for k in range(1, 6):
+        if any(_union(c) == 0b11111 for c in itertools.combinations(masks, k)):
+            return k
+    return 5
+
+
+def _union(masks):
+    u = 0
+    for m in masks:
+        u |= m
+    return u
+
+
+def lattice_depth(profile):
+    """ローテーション半順序の高さ（先行関係で連なるローテーションの最長の鎖の長さ）"""
+    poset = profile.rotations()
+    depth = [0] * len(poset)
+    for r in range(len(poset)):
+        depth[r] = 1 + max((depth[p] for p in poset.preds[r]), default=0)
+    return max(depth, default=0)
+
+
+OBJECTIVES = {
+    "count": stable_count,
+    "disagreement": metric_disagreement,
+    "depth": lattice_depth,
+}
+
+
+def resolve_objective(name):
+    if name in OBJECTIVES:
+        return OBJECTIVES[name]
+    module, _, func = name.partition(":")
+    if not func:
+        raise ValueError(f"目的関数 {name!r} が見つかりません（{', '.join(OBJECTIVES)} か モジュール:関数）")
+    return getattr(importlib.import_module(module), func)
+
+
+# -------------------- 山登り -------------------- #
+def _random_prefs(n, rng):
+    return [rng.sample(range(n), n) for _ in range(n)]
+
+
+def _evaluate(objective, men, women, men_pref, women_pref):
+    profile = PreferenceProfile({m: [women[j] for j in p] for m, p in zip(men, men_pref)},
+                                {w: [men[i] for i in p] for w, p in zip(women, women_pref)})
+    return objective(profile)
+
+
+def _climb(args):
+    # 1 プロセス分: restarts 回の山登りで見つけた (値, 男性の好み, 女性の好み) を返す
+    n, objective_name, restarts, steps, min_score, seed = args
+    objective = resolve_objective(objective_name)
+    men, women = labels(n)
+    rng = random.Random(seed)
+    found = []
+    for _ in range(restarts):
+        men_pref, women_pref = _random_prefs(n, rng), _random_prefs(n, rng)
+        score = _evaluate(objective, men, women, men_pref, women_pref)
+        for _ in range(steps):
+            # 誰か 1 人の好みの隣り合う 2 人を入れ替える．悪くならなければ採用
+            side = men_pref if rng.random() < 0.5 else women_pref
+            pref = side[rng.randrange(n)]
+            t = rng.randrange(n - 1)
+            pref[t], pref[t + 1] = pref[t + 1], pref[t]
+            new_score = _evaluate(objective, men, women, men_pref, women_pref)
+            if new_score >= score:
+                score = new_score
+            else:
+                pref[t], pref[t + 1] = pref[t + 1], pref[t]
+        if score >= min_score:
+            found.append((score, men_pref, women_pref))
+    return found
+
+
+def search(n, objective="count", top=20, workers=None, restarts=50, steps=200, min_score=None, seed=0):
+    """
+    山登りを並列に実行し，同型なものを除いた上位 top 個を
+    [(値, 男性の好み, 女性の好み), ...]（整数のリスト）で返す．
+    """
+    if n < 2:
+        raise ValueError(f"探索は n >= 2 から (n = {n})")
+    resolve_objective(objective)   # 名前の誤りは子プロセスを起動する前に知らせる
+    workers = workers or 1
+    if min_score is None:
+        min_score = float("-inf")
+    jobs = [(n, objective, restarts, steps, min_score, seed * 1000003 + k) for k in range(workers)]
+    if workers == 1:
+        results = [_climb(jobs[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_climb, jobs))
+    unique = {}
+    for score, men_pref, women_pref in itertools.chain.from_iterable(results):
+        key = canonical_key(men_pref, women_pref)
+        if key not in unique or score > unique[key][0]:
+            unique[key] = (score, men_pref, women_pref)
+    return sorted(unique.values(), key=lambda x: -x[0])[:top]
+
+
+def write_module(path, n, results, objective="count"):
+    """best20_prefs.py と同じ形式（BEST_PREFS = {番号: (男性の好み, 女性の好み)}）で書き出す"""
+    men, women = labels(n)
+    lines = ["BEST_PREFS = {"]
+    for k, (score, men_pref, women_pref) in enumerate(results, start=1):
+        mp = {m: [women[j] for j in p] for m, p in zip(men, men_pref)}
+        wp = {w: [men[i] for i in p] for w, p in zip(women, women_pref)}
+        lines.append(f"    {k}: ({mp}, {wp}),  # {objective}={score}")
+    lines.append("}")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="安定マッチングの好みパターンを探索して BEST_PREFS を書き出す")
+    parser.add_argument("--n", type=int, default=4, help="人数（片側）")
+    parser.add_argument("--objective", default="count", help=f"{', '.join(OBJECTIVES)} または モジュール:関数")
+    parser.add_argument("--top", type=int, default=20, help="書き出す個数")
+    parser.add_argument("--workers", type=int, default=None, help="プロセス数（既定は 1）")
+    parser.add_argument("--restarts", type=int, default=50, help="1 プロセスあたりの山登りの回数")
+    parser.add_argument("--steps", type=int, default=200, help="1 回の山登りの手数")
+    parser.add_argument("--min-score", type=float, default=None, help="この値以上のものだけ残す")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default=None, help="書き出すファイル（省略時は標準出力に要約のみ）")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = search(args.n, args.objective, args.top, args.workers, args.restarts, args.steps,
+                     args.min_score, args.seed)
+    elapsed = time.perf_counter() - start
+    print(f"{len(results)} 個 ({elapsed:.1f} 秒)  値: {[score for score, _, _ in results]}")
+    if args.out:
+        write_module(args.out, args.n, results, args.objective)
+        print(f"{args.out} に書き出しました")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+# マッチング図をブラウザで描く（Altair / Vega-Lite）
+#
+# matplotlib の図はサーバで画像にしてから送るので，再実行のたびに描画と圧縮の
+# CPU がかかる．ここではマッチング 1 つを小さな Vega-Lite の仕様（点の位置・辺・
+# 満足度の表示・アイコン）にして送り，描くのはブラウザに任せる．サーバの仕事は
+# 仕様を JSON にするだけになり，図にマウスを乗せるとその人の好みの順が見える．
+# アイコンは縮小した PNG を static/icons/ に置いて Streamlit の静的配信
+# （.streamlit/config.toml の server.enableStaticServing）で送り，仕様には URL だけを
+# 書く．ブラウザは同じ URL の画像をキャッシュするので，何枚描いても 1 回しか送らない．
+
+import json
+import os
+from functools import lru_cache
+
+import altair as alt
+import streamlit as st
+from PIL import Image
+
+from smp_assets import IMAGE_DIR, icon
+from smp_render import ICON_HALF_H, ICON_HALF_W, SPACING, X_MEN, X_WOMEN, _panel_ylim
+
+ICON_SIZE = (45, 36)     # 配信するアイコンの (幅, 高さ)
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+STATIC_URL = "app/static"                 # static/ が配信される場所（ページからの相対 URL）
+
+
+def icon_url(name, size=ICON_SIZE, image_dir=IMAGE_DIR):
+    """
+    アイコンの URL（static/icons/<幅>x<高さ>/<name>.png．ファイルがなければ None）．
+    縮小した PNG がまだ static/ になければ，プロセスで 1 回だけ書き出す．
+    """
+    return _icon_url(name, tuple(size), os.path.abspath(image_dir))
+
+
+@lru_cache(maxsize=None)
+def _icon_url(name, size, image_dir):
+    img = icon(name, size, image_dir)
+    if img is None:
+        return None
+    folder = f"icons/{size[0]}x{size[1]}"
+    path = os.path.join(STATIC_DIR, folder, f"{name}.png")
+    if not os.path.exists(path):
+        # 別のプロセスが同時に書いても壊れないように，一時ファイルに書いてから置き換える
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        Image.fromarray(img).save(tmp, format="PNG", optimize=True)
+        os.replace(tmp, path)
+    return f"{STATIC_URL}/{folder}/{name}.png"
+
+
+def matching_chart(matching, men, women, men_prefs, women_prefs, width=350, image_dir=IMAGE_DIR):
+    """
+    マッチング [(m, w), ...] を Altair のグラフにする（配置は smp_render の図と同じ）．
+    人にマウスを乗せると，その人の辺が強調され，好みの順と相手の順位が出る．
+    """
+    n = len(men)
+    top = n - 1
+    y_min, y_max = _panel_ylim(n)
+    px_per_y = width * 0.8                  # y の 1 あたりのピクセル数（横より少し詰める）
+    height = round(px_per_y * (y_max - y_min))
+    men_y = {m: -k * SPACING for k, m in enumerate(men)}
+    women_y = {w: -k * SPACING for k, w in enumerate(women)}
+
+    edges, nodes = [], []
+    for m, w in matching:
+        edges.append({"pair": m, "x": X_MEN, "y": men_y[m], "x2": X_WOMEN, "y2": women_y[w]})
+        for name, partner, prefs, x, y, side in ((m, w, men_prefs, X_MEN, men_y[m], "男性"),
+                                                   (w, m, women_prefs, X_WOMEN, women_y[w], "女性")):
+            rank = prefs[name].index(partner)
+            nodes.append({
+                "pair": m, "name": name, "side": side, "x": x, "y": y,
+                "label": f"({top - rank}) {name}",
+                "url": icon_url(name, ICON_SIZE, image_dir),
+                "ranking": " > ".join(prefs[name]),
+                "partner": f"{partner}（{rank + 1} 番目）",
+            })
+
+    x = alt.X("x:Q", scale=alt.Scale(domain=[0, 1]), axis=None)
+    y = alt.Y("y:Q", scale=alt.Scale(domain=[y_min, y_max]), axis=None)
+    hover = alt.selection_point(name="hover", on="mouseover", fields=["pair"], empty=False)
+    tooltip = [alt.Tooltip("name:N", title="名前"), alt.Tooltip("ranking:N", title="好み"),
+               alt.Tooltip("partner:N", title="相手")]
+
+    edge_layer = alt.Chart(alt.Data(values=edges)).mark_rule().encode(
+        x=x, y=y, x2="x2:Q", y2="y2:Q",
+        color=alt.condition(hover, alt.value("crimson"), alt.value("black")),
+        strokeWidth=alt.condition(hover, alt.value(3), alt.value(1.2)),
+    )
+    # 人の表は 3 つの層で共通なので最上位に 1 回だけ置く
+    icon_layer = alt.Chart().mark_image(
+        width=round(2 * ICON_HALF_W * width), height=round(2 * ICON_HALF_H * px_per_y),
+    ).encode(x=x, y=y, url="url:N", tooltip=tooltip).add_params(hover)
+    men_labels = alt.Chart().transform_filter(alt.datum.side == "男性").mark_text(
+        align="right", dx=-round(ICON_HALF_W * width) - 4, fontSize=12).encode(x=x, y=y, text="label:N", tooltip=tooltip)
+    women_labels = alt.Chart().transform_filter(alt.datum.side == "女性").mark_text(
+        align="left", dx=round(ICON_HALF_W * width) + 4, fontSize=12).encode(x=x, y=y, text="label:N", tooltip=tooltip)
+    return (alt.layer(edge_layer, icon_layer, men_labels, women_labels, data=alt.Data(values=nodes))
+            .properties(width=width, height=height)
+            .configure_view(stroke=None))
+
+
+def chart_spec(chart):
+    """
+    st.vega_lite_chart にそのまま渡せる仕様（dict）．スキーマの検査は時間の大半を
+    占めるので省く（仕様は matching_chart が決まった形で組み立てている）．
+    """
+    return chart.to_dict(validate=False)
+
+
+def show_chart(spec, budget=None, name="", container=None):
+    """
+    Vega-Lite の仕様を表示し，budget (smp_render.FigureBudget) があれば
+    送る JSON の大きさを "vega" として記録する．
+    """
+    (container or st).vega_lite_chart(spec, use_container_width=True)
+    sent = len(json.dumps(spec, ensure_ascii=False).encode("utf-8"))
+    if budget is not None:
+        budget.add(name, "vega", sent)
+    return sent
@@ -0,0 +1,80 @@
+# アイコン画像のキャッシュ
+#
+# マッチング図はどの辺でも両端のアイコンを描くので，毎回 Image.open と LANCZOS 縮小を
+# すると 1 ページで数十回の PNG 読み込みと縮小が走る．ここでは img/ の各アイコンを
+# 一度だけ読み込み，アプリで使う大きさに縮小した RGBA 配列をプロセス内で保持する
+# （Streamlit の再実行やセッションをまたいでも残る）．
+
+import os
+from functools import lru_cache
+
+import numpy as np
+from PIL import Image
+
+IMAGE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "img")
+
+# アプリで使っている (幅, 高さ)．None は元の大きさ
+SIZES = [(45, 36), (36, 36), (30, 24), (30, 22), None]
+
+
+@lru_cache(maxsize=None)
+def _original(name, image_dir):
+    # image_dir は icon で絶対パスにしてある（"img" と IMAGE_DIR が同じキーになるように）
+    path = os.path.join(image_dir, f"{name}.png")
+    if not os.path.exists(path):
+        return None
+    with Image.open(path) as img:
+        return img.convert("RGBA")
+
+
+def icon(name, size=None, image_dir=IMAGE_DIR):
+    """
+    name のアイコンを (高さ, 幅, 4) の uint8 配列（書き込み不可）で返す．
+    size = (幅, 高さ) なら縮小済み，ファイルがなければ None．
+    image_dir は相対パス（アプリの "img"）でもよい．
+    """
+    return _icon(name, None if size is None else tuple(size), os.path.abspath(image_dir))
+
+
+@lru_cache(maxsize=None)
+def _icon(name, size, image_dir):
+    img = _original(name, image_dir)
+    if img is None:
+        return None
+    if size is not None:
+        img = img.resize(size, Image.LANCZOS)
+    arr = np.asarray(img)
+    arr.flags.writeable = False
+    return arr
+
+
+def names(image_dir=IMAGE_DIR):
+    """image_dir にあるアイコンの名前（拡張子なし）"""
+    return sorted(f[:-4] for f in os.listdir(image_dir) if f.endswith(".png"))
+
+
+def preload(image_dir=IMAGE_DIR, sizes=SIZES):
+    """全アイコンを全サイズで読み込んでおく（起動時に 1 回）"""
+    for name in names(image_dir):
+        for size in sizes:
+            icon(name, size, image_dir)
+
+
+
+@lru_cache(maxsize=None)
+def _atlas(size, image_dir):
+    w, h = size
+    keys = names(image_dir)
+    sheet = np.zeros((h, w * len(keys), 4), dtype=np.uint8)
+    for k, name in enumerate(keys):
+        sheet[:, k * w:(k + 1) * w] = icon(name, size, image_dir)
+    sheet.flags.writeable = False
+    return sheet, {name: sheet[:, k * w:(k + 1) * w] for k, name in enumerate(keys)}
+
+
+def atlas(size, image_dir=IMAGE_DIR):
+    """
+    同じ大きさのアイコンを横に並べた 1 枚の配列 (スプライトアトラス) と，
+    {名前: その部分のビュー} を返す．まとめて描くとき用（smp_render._background）．
+    """
+    return _atlas(tuple(size), os.path.abspath(image_dir))
@@ -0,0 +1,150 @@
+# 計算結果のディスクキャッシュ（SQLite）
+#
+# 安定マッチングの一覧・指標の表・束の辺を，標準形のハッシュ（smp_canon）をキーにして
+# 保存する．名前の付け替えや男女の入れ替えで同じになるパターンは同じ行を使い，
+# 取り出すときに元のパターンの番号に付け替える．サーバを再起動しても残り，
+# 合計サイズが max_bytes を超えたら最後に使ったのが古いものから消す (LRU)．
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+from smp_core import PreferenceProfile
+
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "smp_cache.sqlite3")
+
+
+class ResultCache:
+    """
+    cache = ResultCache()                    # 既定は smp_cache.sqlite3，上限 64MB
+    cache.get(key, kind) / cache.put(key, kind, value)   # 任意の pickle できる値
+    cache.analysis(profile)                  # 一覧・指標・束の辺（元の番号で）
+    """
+
+    def __init__(self, path=DEFAULT_PATH, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        with self._connect() as db:
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("""CREATE TABLE IF NOT EXISTS entries (
+                              key TEXT, kind TEXT, value BLOB, size INTEGER, last_used REAL,
+                              PRIMARY KEY (key, kind))""")
+            db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+
+    @contextmanager
+    def _connect(self):
+        # Streamlit はセッションごとに別スレッドなので，操作ごとに接続し，終わったら
+        # コミット（例外ならロールバック）して閉じる（sqlite3 の with は閉じない）
+        db = sqlite3.connect(self.path, timeout=10)
+        try:
+            with db:
+                yield db
+        finally:
+            db.close()
+
+    def get(self, key, kind):
+        """値を返す（なければ None）．使った時刻を更新する"""
+        with self._lock, self._connect() as db:
+            row = db.execute("SELECT value FROM entries WHERE key = ? AND kind = ?", (key, kind)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            db.execute("UPDATE entries SET last_used = ? WHERE key = ? AND kind = ?", (time.time(), key, kind))
+            self.hits += 1
+        return pickle.loads(row[0])
+
+    def put(self, key, kind, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock, self._connect() as db:
+            db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?)",
+                       (key, kind, blob, len(blob), time.time()))
+            self._evict(db)
+
+    def _evict(self, db):
+        total = db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, kind, size in db.execute("SELECT key, kind, size FROM entries ORDER BY last_used").fetchall():
+            db.execute("DELETE FROM entries WHERE key = ? AND kind = ?", (key, kind))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def size(self):
+        """(件数, 合計バイト数)"""
+        with self._connect() as db:
+            return db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+
+    def clear(self):
+        with self._lock, self._connect() as db:
+            db.execute("DELETE FROM entries")
+
+    # ---------- 安定マッチングの解析結果 ---------- #
+    def analysis(self, profile):
+        """
+        {"matchings": wives のリスト, "satisfaction": 指標の表, "hasse": [(上, 下), ...]} を返す．
+        並びは profile.lattice() と同じ．標準形で保存し，元の番号に付け替えて返す．
+        """
+        (men_pref, women_pref), digest, relabelling = profile.canonical()
+        stored = self.get(digest, "analysis")
+        if stored is None:
+            stored = _analyse(men_pref, women_pref)
+            self.put(digest, "analysis", stored)
+        return _relabel_analysis(stored, relabelling)
+
+
+def _analyse(men_pref, women_pref):
+    # 標準形のパターン（整数）について解析する．女性の名前は n, n+1, ... にする
+    n = len(men_pref)
+    profile = PreferenceProfile({i: [n + j for j in p] for i, p in enumerate(men_pref)},
+                                {n + j: list(p) for j, p in enumerate(women_pref)})
+    lattice = profile.lattice()
+    return {
+        "matchings": [list(w) for w in lattice.matchings],
+        "satisfaction": lattice.satisfaction_table(),
+        "hasse": [(k, low) for k, low, _ in lattice.hasse_edges()],
+    }
+
+
+def _relabel_analysis(stored, relabelling):
+    swapped, men_map, women_map = relabelling
+    n = len(men_map)
+    men_inv = [0] * n
+    women_inv = [0] * n
+    for i, c in enumerate(men_map):
+        men_inv[c] = i
+    for j, c in enumerate(women_map):
+        women_inv[c] = j
+    matchings = []
+    for cw in stored["matchings"]:
+        wives = [0] * n
+        if swapped:
+            # 標準形の男性 = 元の女性
+            for j in range(n):
+                wives[men_inv[cw[women_map[j]]]] = j
+        else:
+            for i in range(n):
+                wives[i] = women_inv[cw[men_map[i]]]
+        matchings.append(wives)
+    satisfaction = [list(row) for row in stored["satisfaction"]]
+    if swapped:
+        for row in satisfaction:
+            row[1], row[2] = row[2], row[1]
+    # profile.lattice() と同じく wives の辞書順に並べ直す
+    order = sorted(range(len(matchings)), key=matchings.__getitem__)
+    position = {k: pos for pos, k in enumerate(order)}
+    hasse = [(position[k], position[low]) for k, low in stored["hasse"]]
+    if swapped:
+        # 男女を入れ替えると束の上下が逆になる
+        hasse = [(low, k) for k, low in hasse]
+    return {
+        "matchings": [matchings[k] for k in order],
+        "satisfaction": [satisfaction[k] for k in order],
+        "hasse": sorted(hasse),
+    }
@@ -0,0 +1,90 @@
+# 好みパターンの標準形（名前の付け替え・男女の入れ替えで同じものを 1 つにまとめる）
+#
+# 男性・女性の番号の振り直しと男女の入れ替えで移り合うパターンは，安定マッチングの
+# 個数も各指標の値も同じになる．標準形とハッシュを共通のキーにすれば，
+# キャッシュ・探索・集計の結果を同型なパターンの間で使い回せる．
+#
+# 標準形 = (男性の好み, 女性の好み) を番号の振り直しで辞書順最小にしたもの．
+# 先頭の男性の好みは必ず 0, 1, ..., n-1 にできるので，先頭の男性を決めれば女性の番号は
+# 決まり，残りの男性は好みの辞書順に並べるだけでよい．好みがまったく同じ男性の
+# 並べ方だけは女性側の好みを先頭から読んで貪欲に決める．全体で O(n^3 log n)．
+
+import hashlib
+from collections import deque
+
+
+def canonical_form(men_pref, women_pref):
+    """
+    整数の好みリストの標準形を返す．((men, women), digest, (swapped, men_map, women_map))
+      men, women : 標準形の好み（タプルのタプル）
+      digest     : 標準形の 16 進ハッシュ（プロセスや実行をまたいで変わらない）
+      swapped    : 男女を入れ替えたか
+      men_map[i] : 元の男性 i の標準形での番号（swapped なら標準形の女性側の番号）
+      women_map[j] も同様
+    """
+    n = len(men_pref)
+    best = None
+    for swapped, (a, b) in enumerate(((men_pref, women_pref), (women_pref, men_pref))):
+        for first in range(n):
+            candidate = _best_with_first(a, b, first)
+            if best is None or candidate[0] < best[0]:
+                best = candidate + (bool(swapped),)
+    (rows, cols), row_map, col_map, swapped = best
+    men_map, women_map = (col_map, row_map) if swapped else (row_map, col_map)
+    return (rows, cols), _digest(n, rows, cols), (swapped, men_map, women_map)
+
+
+def canonical_key(men_pref, women_pref):
+    """標準形だけを返す（dict のキー用）"""
+    return canonical_form(men_pref, women_pref)[0]
+
+
+def canonical_hash(men_pref, women_pref):
+    """標準形のハッシュだけを返す"""
+    return canonical_form(men_pref, women_pref)[1]
+
+
+def apply_relabelling(men_pref, women_pref, relabelling):
+    """canonical_form が返した (swapped, men_map, women_map) で好みを付け替える（結果は標準形）"""
+    swapped, men_map, women_map = relabelling
+    n = len(men_pref)
+    new_men = [None] * n
+    new_women = [None] * n
+    for i, p in enumerate(men_pref):
+        new_men[men_map[i]] = tuple(women_map[j] for j in p)
+    for j, p in enumerate(women_pref):
+        new_women[women_map[j]] = tuple(men_map[i] for i in p)
+    if swapped:
+        new_men, new_women = new_women, new_men
+    return tuple(new_men), tuple(new_women)
+
+
+def _best_with_first(a, b, first):
+    # 側 a の first 番を先頭にしたときの最小の (標準形, a の番号の対応, b の番号の対応)
+    n = len(a)
+    col_map = [0] * n
+    for pos, j in enumerate(a[first]):
+        col_map[j] = pos
+    relabelled = [tuple(col_map[j] for j in p) for p in a]
+    rest = sorted((i for i in range(n) if i != first), key=relabelled.__getitem__)
+    rows = (relabelled[first],) + tuple(relabelled[i] for i in rest)
+    # 好みが同じ男性の組は並べ替えても rows が変わらないので，組ごとの空き番号を持っておき，
+    # 女性側の好みを標準形の順に読んで，初めて出てきた男性に組の空き番号の最小を割り当てる．
+    # 各位置の値はその男性の番号だけで決まるので，この貪欲法で cols が辞書順最小になる
+    free = {}
+    for pos, i in enumerate(rest, start=1):
+        free.setdefault(relabelled[i], deque()).append(pos)
+    row_map = [None] * n
+    row_map[first] = 0
+    b_order = sorted(range(n), key=col_map.__getitem__)
+    for j in b_order:
+        for i in b[j]:
+            if row_map[i] is None:
+                row_map[i] = free[relabelled[i]].popleft()
+    cols = tuple(tuple(row_map[i] for i in b[j]) for j in b_order)
+    return (rows, cols), row_map, col_map
+
+
+def _digest(n, rows, cols):
+    data = f"{n}:" + ",".join(str(v) for p in rows + cols for v in p)
+    return hashlib.blake2b(data.encode("ascii"), digest_size=16).hexdigest()
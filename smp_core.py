@@ -0,0 +1,369 @@
+# 安定マッチング計算の共通エンジン
+#
+# 各アプリは好みを {"A": ["X", "Y", ...], ...} の辞書で持っているが，
+# 安定性判定や満足度計算で list.index を繰り返すと 1 回の判定が O(n^3) になる．
+# PreferenceProfile は好み 1 組につき一度だけ順位表（逆引き配列）を作り，
+# 以降の判定・指標計算はすべて O(1) の表引きで行う．
+#
+# PreferenceProfile と Matching は作った後に変更できない．値（名前と好み / 相手の番号）で
+# 比較・ハッシュできるので，dict やキャッシュのキーにそのまま使える．
+
+from types import MappingProxyType
+
+import numpy as np
+
+from smp_canon import canonical_form
+from smp_lattice import StableMatchingLattice
+from smp_rotations import RotationPoset
+from smp_trace import GSTrace
+
+
+def index_dtype(n):
+    """番号 0〜n-1 が入る最小の整数型"""
+    if n <= np.iinfo(np.int8).max:
+        return np.int8
+    if n <= np.iinfo(np.int16).max:
+        return np.int16
+    return np.int32
+
+
+def _frozen(values, n):
+    arr = np.array(values, dtype=index_dtype(n))
+    arr.flags.writeable = False
+    return arr
+
+
+def _immutable(self, name, value=None):
+    raise AttributeError(f"{type(self).__name__} は変更できません ({name})")
+
+
+_set = object.__setattr__
+
+
+# -------------------- マッチング -------------------- #
+class Matching:
+    """
+    マッチングを番号の配列で持つ．どちらの向きの相手も O(1) で引ける．
+      wives[i]    : 男性 i の相手の番号
+      husbands[j] : 女性 j の相手の番号
+    どちらも書き込み不可の int8 / int16 配列（n に応じて最小の型）．
+    """
+
+    __slots__ = ("wives", "husbands", "_key", "_hash")
+
+    def __init__(self, wives):
+        n = len(wives)
+        values = np.asarray(wives, dtype=np.int64)
+        if n and (values.min() < 0 or values.max() >= n):
+            raise ValueError(f"wives の値が 0〜{n - 1} の範囲にない ({values.tolist()})")
+        wives = _frozen(values, n)
+        husbands = np.full(n, -1, dtype=wives.dtype)
+        husbands[wives] = np.arange(n)
+        if n and husbands.min() < 0:
+            raise ValueError(f"wives が 0〜{n - 1} の並べ替えになっていない ({wives.tolist()})")
+        husbands.flags.writeable = False
+        _set(self, "wives", wives)
+        _set(self, "husbands", husbands)
+        _set(self, "_key", wives.tobytes())
+        _set(self, "_hash", hash(self._key))
+
+    __setattr__ = _immutable
+    __delattr__ = _immutable
+
+    def __reduce__(self):
+        return Matching, (self.wives.tolist(),)
+
+    def __len__(self):
+        return len(self.wives)
+
+    def __iter__(self):
+        """(男性の番号, 女性の番号) を男性の順に返す"""
+        return iter(enumerate(self.wives.tolist()))
+
+    def __eq__(self, other):
+        return isinstance(other, Matching) and self._key == other._key
+
+    def __hash__(self):
+        return self._hash
+
+    def __repr__(self):
+        return f"Matching({self.wives.tolist()})"
+
+    def wife(self, i):
+        return int(self.wives[i])
+
+    def husband(self, j):
+        return int(self.husbands[j])
+
+
+# -------------------- 好みプロファイル -------------------- #
+class PreferenceProfile:
+    """
+    男女の好みを整数インデックスの表（タプル）で保持する．
+
+      men_pref[i][r]   : 男性 i が r 番目に好む女性の番号
+      men_rank[i][j]   : 男性 i にとっての女性 j の順位 (0 が最も好き)
+      women_pref / women_rank も同様
+      man_index[m]     : 男性の名前 m の番号（woman_index も同様．読み取り専用の辞書）
+
+    配列演算用には同じ表を n に応じた int8 / int16 の書き込み不可配列でも返す（arrays()）．
+    """
+
+    __slots__ = ("men", "women", "n", "man_index", "woman_index",
+                 "men_pref", "women_pref", "men_rank", "women_rank",
+                 "_arrays", "_key", "_hash", "_rotations", "_lattice")
+
+    def __init__(self, men_prefs, women_prefs):
+        men = tuple(men_prefs)
+        women = tuple(women_prefs)
+        man_index = {m: i for i, m in enumerate(men)}
+        woman_index = {w: j for j, w in enumerate(women)}
+        men_pref = tuple(tuple(woman_index[w] for w in men_prefs[m]) for m in men)
+        women_pref = tuple(tuple(man_index[m] for m in women_prefs[w]) for w in women)
+        men_rank = tuple(tuple(_inverse(p)) for p in men_pref)
+        women_rank = tuple(tuple(_inverse(p)) for p in women_pref)
+        _set(self, "men", men)
+        _set(self, "women", women)
+        _set(self, "n", len(men))
+        _set(self, "man_index", MappingProxyType(man_index))
+        _set(self, "woman_index", MappingProxyType(woman_index))
+        _set(self, "men_pref", men_pref)
+        _set(self, "women_pref", women_pref)
+        _set(self, "men_rank", men_rank)
+        _set(self, "women_rank", women_rank)
+        _set(self, "_arrays", None)
+        _set(self, "_key", (men, women, men_pref, women_pref))
+        _set(self, "_hash", None)
+        _set(self, "_rotations", None)
+        _set(self, "_lattice", None)
+
+    @classmethod
+    def from_arrays(cls, men_pref, women_pref, men=None, women=None):
+        """番号の好み (n, n) から作る．名前を省くと 0〜n-1 と n〜2n-1"""
+        n = len(men_pref)
+        men = list(range(n)) if men is None else list(men)
+        women = list(range(n, 2 * n)) if women is None else list(women)
+        return cls({m: [women[j] for j in p] for m, p in zip(men, np.asarray(men_pref).tolist())},
+                   {w: [men[i] for i in p] for w, p in zip(women, np.asarray(women_pref).tolist())})
+
+    __setattr__ = _immutable
+    __delattr__ = _immutable
+
+    def __reduce__(self):
+        return PreferenceProfile, self.to_dicts()
+
+    def __eq__(self, other):
+        return isinstance(other, PreferenceProfile) and self._key == other._key
+
+    def __hash__(self):
+        if self._hash is None:
+            _set(self, "_hash", hash(self._key))
+        return self._hash
+
+    def to_dicts(self):
+        """アプリで使っている {名前: [名前, ...]} の辞書の組に戻す"""
+        return ({m: [self.women[j] for j in p] for m, p in zip(self.men, self.men_pref)},
+                {w: [self.men[i] for i in p] for w, p in zip(self.women, self.women_pref)})
+
+    def arrays(self):
+        """
+        (men_pref, women_pref, men_rank, women_rank) の書き込み不可の (n, n) 配列（int8 / int16）．
+        初めて呼ばれたときに作る（表引きだけの計算では作らない）．
+        """
+        if self._arrays is None:
+            n = self.n
+            _set(self, "_arrays", tuple(_frozen(t, n).reshape(n, n) for t in
+                                        (self.men_pref, self.women_pref, self.men_rank, self.women_rank)))
+        return self._arrays
+
+    def matching(self, matching):
+        """[(m, w), ...] / wives / Matching を Matching にする"""
+        if isinstance(matching, Matching):
+            return matching
+        return Matching(self.as_wives(matching))
+
+    # ---------- ラベル <-> 番号 変換 ---------- #
+    def to_wives(self, matching):
+        """[(m, w), ...] を wives[i] = 男性 i の相手の番号 の形に変換"""
+        wives = [0] * self.n
+        for m, w in matching:
+            wives[self.man_index[m]] = self.woman_index[w]
+        return wives
+
+    def to_pairs(self, wives):
+        """wives 配列を [(m, w), ...]（男性の並び順）に戻す"""
+        return [(self.men[i], self.women[j]) for i, j in enumerate(wives)]
+
+    def as_wives(self, matching):
+        # ラベルのペア列・番号配列・Matching のどれも受け付ける
+        if isinstance(matching, Matching):
+            return matching.wives.tolist()
+        if len(matching) and isinstance(matching[0], tuple):
+            return self.to_wives(matching)
+        return list(matching)
+
+    # ---------- 安定性判定 ---------- #
+    def _pair_args(self, matching):
+        # 判定に使う (wives, husbands, ...)．Matching なら作ってある husbands をそのまま使う
+        matching = self.matching(matching)
+        return (matching.wives.tolist(), matching.husbands.tolist(),
+                self.men_pref, self.men_rank, self.women_rank)
+
+    def find_blocking_pair(self, matching):
+        """最初に見つかったブロッキングペア (m, w) を返す．安定なら None"""
+        i, j = _first_blocking_pair(*self._pair_args(matching))
+        if i is None:
+            return None
+        return self.men[i], self.women[j]
+
+    def blocking_pairs(self, matching):
+        """すべてのブロッキングペア [(m, w), ...] を返す．O(n^2)"""
+        return [(self.men[i], self.women[j]) for i, j in _blocking_pairs(*self._pair_args(matching))]
+
+    def is_stable(self, matching):
+        i, _ = _first_blocking_pair(*self._pair_args(matching))
+        return i is None
+
+    # ---------- 受入保留 (Gale-Shapley) ---------- #
+    def man_optimal(self):
+        """男性から提案する受入保留で男性最適安定マッチング (wives) を返す"""
+        return deferred_acceptance(self.men_pref, self.women_rank)
+
+    def woman_optimal(self):
+        """女性から提案する受入保留で女性最適安定マッチング (wives) を返す"""
+        husbands = deferred_acceptance(self.women_pref, self.men_rank)
+        return _inverse(husbands)
+
+    def gs_trace(self, women_propose=False, interval=8):
+        """受入保留の提案の記録（smp_trace.GSTrace）．women_propose なら女性が提案する"""
+        if women_propose:
+            return GSTrace(self.women_pref, self.men_rank, interval)
+        return GSTrace(self.men_pref, self.women_rank, interval)
+
+    def canonical(self):
+        """
+        名前の付け替え・男女の入れ替えで同じパターンに共通の標準形．
+        ((men, women), ハッシュ, (swapped, men_map, women_map)) を返す（smp_canon 参照）
+        """
+        return canonical_form(self.men_pref, self.women_pref)
+
+    # ---------- 安定マッチング列挙 ---------- #
+    def rotations(self):
+        if self._rotations is None:
+            _set(self, "_rotations", RotationPoset(self))
+        return self._rotations
+
+    def lattice(self):
+        if self._lattice is None:
+            _set(self, "_lattice", StableMatchingLattice(self, self.rotations()))
+        return self._lattice
+
+    def all_stable_matchings(self):
+        """
+        ローテーション半順序から全安定マッチングを列挙し [(m, w), ...] のリストで返す．
+        並びは従来の順列総当たりと同じ（女性番号の辞書順）．
+        """
+        return [self.to_pairs(wives) for wives in self.lattice().matchings]
+
+    def count_stable_matchings(self, max_states=100000, samples=1000, seed=None):
+        """
+        安定マッチングの個数を列挙せずに求める．(個数, 標準誤差) を返す．
+        半順序が小さければ厳密に数えて誤差 0，大きすぎればサンプリングで推定する．
+        """
+        poset = self.rotations()
+        count = poset.count_ideals(max_states)
+        if count is not None:
+            return count, 0
+        return poset.estimate_ideals(samples, seed)
+
+    # ---------- 満足度計算 ---------- #
+    def dissatisfaction(self, matching):
+        """(不満度合計, 男性和, 女性和, 差, 最大) を返す．不満度 = 順位"""
+        wives = self.as_wives(matching)
+        man_score = 0
+        woman_score = 0
+        max_score = 0
+        for i, j in enumerate(wives):
+            rm = self.men_rank[i][j]
+            rw = self.women_rank[j][i]
+            man_score += rm
+            woman_score += rw
+            if rm > max_score:
+                max_score = rm
+            if rw > max_score:
+                max_score = rw
+        total = man_score + woman_score
+        return total, man_score, woman_score, abs(man_score - woman_score), max_score
+
+    def satisfaction(self, matching):
+        """
+        5つの指標 [満足度合計, 男性和, 女性和, 差, 最小] を返す．
+        満足度 = (n - 1) - 順位 （4人なら最も好きな相手で 3）
+        """
+        total, ms, ws, _, maxd = self.dissatisfaction(matching)
+        top = self.n - 1
+        ms_satis = top * self.n - ms
+        ws_satis = top * self.n - ws
+        return [top * 2 * self.n - total, ms_satis, ws_satis, abs(ms_satis - ws_satis), top - maxd]
+
+
+def _inverse(perm):
+    inv = [0] * len(perm)
+    for r, x in enumerate(perm):
+        inv[x] = r
+    return inv
+
+
+def _iter_blocking_pairs(wives, husbands, men_pref, men_rank, women_rank):
+    # 男性 i が今の相手より好む女性 j について，j も i を今の相手より好めばブロッキング
+    for i, j in enumerate(wives):
+        for j2 in men_pref[i][:men_rank[i][j]]:
+            rank_j2 = women_rank[j2]
+            if rank_j2[i] < rank_j2[husbands[j2]]:
+                yield i, j2
+
+
+def _first_blocking_pair(wives, husbands, men_pref, men_rank, women_rank):
+    return next(_iter_blocking_pairs(wives, husbands, men_pref, men_rank, women_rank), (None, None))
+
+
+def _blocking_pairs(wives, husbands, men_pref, men_rank, women_rank):
+    return list(_iter_blocking_pairs(wives, husbands, men_pref, men_rank, women_rank))
+
+
+def deferred_acceptance(proposer_pref, receiver_rank):
+    """
+    受入保留方式．proposer_pref[i] は提案側 i の好み（番号列），
+    receiver_rank[j][i] は受け手 j にとっての i の順位．
+    提案側 i の相手の番号を並べたリストを返す．O(n^2)
+    """
+    n = len(proposer_pref)
+    nxt = [0] * n
+    holder = [-1] * n
+    free = list(range(n - 1, -1, -1))
+    while free:
+        i = free.pop()
+        j = proposer_pref[i][nxt[i]]
+        nxt[i] += 1
+        cur = holder[j]
+        if cur < 0:
+            holder[j] = i
+        elif receiver_rank[j][i] < receiver_rank[j][cur]:
+            holder[j] = i
+            free.append(cur)
+        else:
+            free.append(i)
+    return _inverse(holder)
+
+
+# -------------------- 従来の関数形式 -------------------- #
+def is_stable(matching, men_prefs, women_prefs):
+    return PreferenceProfile(men_prefs, women_prefs).is_stable(matching)
+
+
+def all_stable_matchings(men_prefs, women_prefs):
+    return PreferenceProfile(men_prefs, women_prefs).all_stable_matchings()
+
+
+def calculate_dissatisfaction(matching, men_prefs, women_prefs):
+    return PreferenceProfile(men_prefs, women_prefs).dissatisfaction(matching)
@@ -0,0 +1,180 @@
+# 大きな好みプロファイル（n = 数千〜数万）の保存と計算
+#
+# 完全な好みは男女で 2n^2 個の番号になり，n = 20000 だと 8 億個ある．文字列のリストでは
+# 数十 GB，int32 の配列でも 3.2 GB になるので，ここでは番号が入る最小の整数型
+# （n <= 32767 なら int16 で 1.6 GB）の配列で持ち，必要なら .npy を memmap で開いて
+# 使う部分だけを読み込む．順位表（逆引き）は使うときに初めて，行ごとに区切って作る．
+# 受入保留は smp_vector.deferred_acceptance_rounds，安定性判定は好みの先頭から
+# 順に見ていく方法で，どちらも n×n の一時配列を作らない．
+
+import os
+
+import numpy as np
+
+from smp_core import PreferenceProfile, index_dtype
+from smp_vector import deferred_acceptance_rounds
+
+BLOCK = 1 << 24          # 行ごとに区切って処理するときの 1 区切りの要素数の目安
+FILES = ("men_pref", "women_pref", "men_rank", "women_rank")
+
+
+def _rows(n):
+    return max(1, BLOCK // max(n, 1))
+
+
+def _create(path, name, n, dtype):
+    # path があれば .npy の memmap，なければメモリ上の配列
+    if path is None:
+        return np.empty((n, n), dtype=dtype)
+    return np.lib.format.open_memmap(os.path.join(path, f"{name}.npy"), mode="w+", dtype=dtype, shape=(n, n))
+
+
+class LargeProfile:
+    """
+    番号だけで持つ大きな好み．男性 i, 女性 j はどちらも 0〜n-1．
+      lp = LargeProfile.random(20000, seed=0, path="p20k")   # p20k/men_pref.npy などに書き出す
+      lp = LargeProfile.load("p20k")                         # memmap で開く（読み込まない）
+      wives, rounds, proposals = lp.man_optimal()           # 女性の順位表だけが作られる
+      lp.is_stable(wives)
+    men_rank / women_rank は初めて使うときに作る．既定ではメモリ上に置き，好みの
+    ディレクトリには何も書かない（共有・読み取り専用でもよい）．rank_dir を渡したときだけ
+    そこに .npy の memmap で作って残す（メモリに載せたくなければ一時ディレクトリを渡す）．
+    """
+
+    def __init__(self, men_pref, women_pref, rank_dir=None):
+        n = len(men_pref)
+        dtype = index_dtype(n)
+        self.n = n
+        self.rank_dir = rank_dir
+        self.men_pref = men_pref if men_pref.dtype == dtype else men_pref.astype(dtype)
+        self.women_pref = women_pref if women_pref.dtype == dtype else women_pref.astype(dtype)
+        self._men_rank = None
+        self._women_rank = None
+
+    # ---------- 作成・保存・読み込み ---------- #
+    @classmethod
+    def random(cls, n, seed=None, path=None, rank_dir=None):
+        """一様ランダムな好み．path を渡すとそのディレクトリに .npy で書きながら作る"""
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+        rng = np.random.default_rng(seed)
+        dtype = index_dtype(n)
+        tables = []
+        for name in FILES[:2]:
+            table = _create(path, name, n, dtype)
+            step = _rows(n)
+            for start in range(0, n, step):
+                block = np.tile(np.arange(n, dtype=dtype), (min(step, n - start), 1))
+                table[start:start + step] = rng.permuted(block, axis=1, out=block)
+            tables.append(table)
+        return cls(*tables, rank_dir=rank_dir)
+
+    @classmethod
+    def load(cls, path, mmap=True, rank_dir=None):
+        """
+        save / random(path=...) で書いたディレクトリを開く．mmap なら必要な部分だけ読む．
+        path には書き込まない（保存済みの順位表があれば読むだけ）．
+        """
+        mode = "r" if mmap else None
+        lp = cls(np.load(os.path.join(path, "men_pref.npy"), mmap_mode=mode),
+                 np.load(os.path.join(path, "women_pref.npy"), mmap_mode=mode), rank_dir=rank_dir)
+        for name in FILES[2:]:
+            file = os.path.join(path, f"{name}.npy")
+            if os.path.exists(file):
+                setattr(lp, f"_{name}", np.load(file, mmap_mode=mode))
+        return lp
+
+    def save(self, path):
+        """好みを path/men_pref.npy, path/women_pref.npy に書く（作ってある順位表も）"""
+        os.makedirs(path, exist_ok=True)
+        tables = (self.men_pref, self.women_pref, self._men_rank, self._women_rank)
+        for name, table in zip(FILES, tables):
+            if table is not None:
+                np.save(os.path.join(path, f"{name}.npy"), table)
+
+    @classmethod
+    def from_profile(cls, profile):
+        men_pref, women_pref, _, _ = profile.arrays()
+        return cls(np.array(men_pref), np.array(women_pref))
+
+    def to_profile(self):
+        """PreferenceProfile にする（名前は 0〜n-1 と n〜2n-1．小さい n 向け）"""
+        return PreferenceProfile.from_arrays(self.men_pref, self.women_pref)
+
+    def nbytes(self):
+        """今持っている表の合計バイト数（memmap はファイルの大きさ）"""
+        tables = (self.men_pref, self.women_pref, self._men_rank, self._women_rank)
+        return sum(t.nbytes for t in tables if t is not None)
+
+    # ---------- 順位表（遅延） ---------- #
+    def _rank(self, pref, name):
+        n = self.n
+        if self.rank_dir is not None:
+            os.makedirs(self.rank_dir, exist_ok=True)
+        rank = _create(self.rank_dir, name, n, pref.dtype)
+        order = np.arange(n, dtype=pref.dtype)
+        step = _rows(n)
+        for start in range(0, n, step):
+            block = np.asarray(pref[start:start + step], dtype=np.intp)
+            out = np.empty(block.shape, dtype=pref.dtype)
+            np.put_along_axis(out, block, np.broadcast_to(order, block.shape), axis=1)
+            rank[start:start + step] = out
+        return rank
+
+    @property
+    def men_rank(self):
+        if self._men_rank is None:
+            self._men_rank = self._rank(self.men_pref, "men_rank")
+        return self._men_rank
+
+    @property
+    def women_rank(self):
+        if self._women_rank is None:
+            self._women_rank = self._rank(self.women_pref, "women_rank")
+        return self._women_rank
+
+    # ---------- 受入保留 ---------- #
+    def man_optimal(self):
+        """男性提案の受入保留．(wives, rounds, proposals)．女性の順位表だけを使う"""
+        return deferred_acceptance_rounds(self.men_pref, self.women_rank)
+
+    def woman_optimal(self):
+        """女性提案の受入保留．(wives, rounds, proposals)．男性の順位表だけを使う"""
+        husbands, rounds, proposals = deferred_acceptance_rounds(self.women_pref, self.men_rank)
+        return np.argsort(husbands), rounds, proposals
+
+    # ---------- 安定性判定 ---------- #
+    def blocking_pairs(self, wives, limit=None):
+        """
+        ブロッキングペアを (k, 2) の配列 [[男性, 女性], ...] で返す（limit 個で打ち切る）．
+        男性の好みを先頭から 1 列ずつ見て，今の相手より好きな女性 j について女性側の
+        順位表を引くので，手間は各男性の相手の順位の合計（受入保留の結果なら小さい）．
+        男性の順位表は使わない．
+        """
+        wives = np.asarray(wives, dtype=np.intp)
+        n = self.n
+        husbands = np.empty(n, dtype=np.intp)
+        husbands[wives] = np.arange(n)
+        women_rank = self.women_rank
+        own_w = women_rank[np.arange(n), husbands].astype(np.intp)     # 女性 j の今の相手の順位
+        active = np.arange(n)                  # まだ自分の相手に行き着いていない男性
+        found = []
+        count = 0
+        for r in range(n):
+            if not active.size:
+                break
+            j = self.men_pref[active, r].astype(np.intp)
+            reached = j == wives[active]
+            active, j = active[~reached], j[~reached]
+            block = women_rank[j, active] < own_w[j]
+            if block.any():
+                pairs = np.stack([active[block], j[block]], axis=1)
+                found.append(pairs)
+                count += len(pairs)
+                if limit is not None and count >= limit:
+                    break
+        pairs = np.concatenate(found) if found else np.empty((0, 2), dtype=np.intp)
+        return pairs if limit is None else pairs[:limit]
+
+    def is_stable(self, wives):
+        return len(self.blocking_pairs(wives, limit=1)) == 0
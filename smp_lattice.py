@@ -0,0 +1,127 @@
+# 安定マッチングの束 (lattice)
+#
+# 安定マッチング全体は「男性にとって良い順」の半順序で分配束になる．
+# 2つのマッチングの join / meet は各男性ごとに良い方 / 悪い方の相手を
+# 取るだけで求まり，隣接関係（Hasse 図の辺）はローテーション 1 つの除去に対応する．
+
+
+class StableMatchingLattice:
+    """
+    matchings[k] : k 番目の安定マッチング (wives)．並びは all_stable_matchings と同じ
+    index        : {Matching: k}（index_of で引く）
+    ideals[k]    : matchings[k] までに除去したローテーション番号の集合
+    上の方ほど男性に有利（男性最適が最上位，女性最適が最下位）．
+    """
+
+    def __init__(self, profile, poset=None):
+        self.profile = profile
+        self.poset = poset if poset is not None else profile.rotations()
+        self.matchings = sorted(self.poset.iter_matchings())
+        self.index = {profile.matching(w): k for k, w in enumerate(self.matchings)}   # Matching -> 番号
+        self.ideals = [self.poset.ideal_of(w) for w in self.matchings]
+        self._by_ideal = {ideal: k for k, ideal in enumerate(self.ideals)}
+        self._rank_sums = None
+
+    def __len__(self):
+        return len(self.matchings)
+
+    def index_of(self, matching):
+        """[(m, w), ...] / wives / Matching から番号を返す"""
+        return self.index[self.profile.matching(matching)]
+
+    # ---------- 指標 ---------- #
+    def rank_sums(self):
+        """各マッチングの (男性の順位和, 女性の順位和)．ローテーションの増分から求めて保持する"""
+        if self._rank_sums is None:
+            self._rank_sums = [self.poset.rank_sums(ideal) for ideal in self.ideals]
+        return self._rank_sums
+
+    def satisfaction_table(self):
+        """
+        各マッチングの [満足度合計, 男性和, 女性和, 差, 最小] のリスト．
+        最小以外は rank_sums から O(1)，最小だけは O(n) で求める．
+        """
+        n = self.profile.n
+        top = n - 1
+        men_rank, women_rank = self.profile.men_rank, self.profile.women_rank
+        table = []
+        for wives, (ms, ws) in zip(self.matchings, self.rank_sums()):
+            ms_satis = top * n - ms
+            ws_satis = top * n - ws
+            worst = max((max(men_rank[i][j], women_rank[j][i]) for i, j in enumerate(wives)), default=0)
+            table.append([ms_satis + ws_satis, ms_satis, ws_satis, abs(ms_satis - ws_satis), top - worst])
+        return table
+
+    def weighted_satisfaction(self, men_weight=1, women_weight=1):
+        """男性和・女性和の重み付き和を全マッチングについて返す（重みを変えても再計算は O(1) ずつ）"""
+        n = self.profile.n
+        top_sum = (n - 1) * n
+        return [men_weight * (top_sum - ms) + women_weight * (top_sum - ws) for ms, ws in self.rank_sums()]
+
+    # ---------- 比較 ---------- #
+    def dominates(self, a, b):
+        """a が b を男性側から支配する（全男性が a の相手を同等以上に好む）か．O(n)"""
+        men_rank = self.profile.men_rank
+        return all(men_rank[i][a[i]] <= men_rank[i][b[i]] for i in range(self.profile.n))
+
+    def compare(self, a, b):
+        """-1: a が男性に有利, 1: b が男性に有利, 0: 同じ, None: 比較不能"""
+        if list(a) == list(b):
+            return 0
+        if self.dominates(a, b):
+            return -1
+        if self.dominates(b, a):
+            return 1
+        return None
+
+    def join(self, a, b):
+        """各男性が良い方の相手を取る（男性側の上限）．O(n)"""
+        men_rank = self.profile.men_rank
+        return [a[i] if men_rank[i][a[i]] <= men_rank[i][b[i]] else b[i] for i in range(self.profile.n)]
+
+    def meet(self, a, b):
+        """各男性が悪い方の相手を取る（男性側の下限）．O(n)"""
+        men_rank = self.profile.men_rank
+        return [a[i] if men_rank[i][a[i]] >= men_rank[i][b[i]] else b[i] for i in range(self.profile.n)]
+
+    # ---------- 隣接 ---------- #
+    def lower_covers(self, k):
+        """ローテーションを 1 つ除去して到達できるマッチング [(番号, ローテーション番号), ...]"""
+        ideal = self.ideals[k]
+        preds = self.poset.preds
+        result = []
+        for r in range(len(self.poset)):
+            if r not in ideal and all(p in ideal for p in preds[r]):
+                result.append((self._by_ideal[ideal | {r}], r))
+        return result
+
+    def upper_covers(self, k):
+        """ローテーションを 1 つ戻して到達できるマッチング [(番号, ローテーション番号), ...]"""
+        ideal = self.ideals[k]
+        succs = self.poset.succs
+        result = []
+        for r in ideal:
+            if not any(s in ideal for s in succs[r]):
+                result.append((self._by_ideal[ideal - {r}], r))
+        return sorted(result)
+
+    def hasse_edges(self):
+        """Hasse 図の辺 (上の番号, 下の番号, ローテーション番号) のリスト"""
+        return [(k, low, r) for k in range(len(self)) for low, r in self.lower_covers(k)]
+
+    def to_dot(self, labels=None):
+        """
+        Hasse 図を Graphviz の DOT 文字列で返す（st.graphviz_chart でそのまま描ける）．
+        labels を渡すと節点名に使う（例: ローマ数字）．
+        """
+        if labels is None:
+            labels = [str(k + 1) for k in range(len(self))]
+        lines = ["digraph lattice {", "  rankdir=TB;", '  node [shape=box, fontsize=10];']
+        for k, wives in enumerate(self.matchings):
+            pairs = ", ".join(f"{m}→{w}" for m, w in self.profile.to_pairs(wives))
+            lines.append(f'  n{k} [label="{labels[k]}\\n{pairs}"];')
+        for k, low, r in self.hasse_edges():
+            rot = " ".join(f"{self.profile.men[m]}{self.profile.women[w]}" for m, w in self.poset.rotations[r])
+            lines.append(f'  n{k} -> n{low} [label="ρ{r + 1}", tooltip="{rot}", fontsize=8];')
+        lines.append("}")
+        return "\n".join(lines)
@@ -0,0 +1,252 @@
+# 図の書き出し（表示幅に合わせた解像度・SVG / WebP・送信量の記録）
+#
+# マッチング図は 6×2.4 インチを dpi=800 で描いているので，st.pyplot に渡すと
+# 1 枚あたり約 4800×1920 の PNG がブラウザに送られる．実際の表示幅は数百ピクセル
+# なので，表示幅（と画面の画素密度）から dpi を決めて書き出し，
+# ベクタで足りる図は SVG，写真的な図は WebP にして送る量を減らす．
+#
+# 図は pyplot を通さずに matplotlib.figure.Figure で作る（subplots）．pyplot の
+# 図の登録簿に載らないので，閉じ忘れてもサーバのメモリが増え続けることはなく，
+# 描き終えたら close_figure で明示的に中身を捨てる．
+
+import base64
+import io
+import math
+import sys
+import weakref
+from functools import lru_cache
+
+import matplotlib.pyplot as plt
+import numpy as np
+import streamlit as st
+from matplotlib.figure import Figure
+from PIL import Image
+
+from smp_assets import IMAGE_DIR, atlas
+
+FORMATS = ("png", "webp", "svg")
+PIXEL_RATIO = 2          # 高精細ディスプレイでもぼやけない程度
+WEBP_QUALITY = 85
+
+
+_open_figures = weakref.WeakSet()    # subplots で作ってまだ close していない図
+
+
+# -------------------- 図の作成と後始末 -------------------- #
+def subplots(figsize=None, dpi=None, **kwargs):
+    """plt.subplots の代わり．pyplot に登録しない Figure と Axes を返す"""
+    fig = Figure(figsize=figsize, dpi=dpi)
+    ax = fig.subplots(**kwargs)
+    _open_figures.add(fig)
+    return fig, ax
+
+
+def close_figure(fig):
+    """図の中身を捨てる（pyplot で作った図なら登録も外す）"""
+    plt.close(fig)
+    fig.clear()
+    _open_figures.discard(fig)
+
+
+def show_pyplot(fig, container=None):
+    """st.pyplot で表示してすぐ閉じる"""
+    (container or st).pyplot(fig)
+    close_figure(fig)
+
+
+def rss_bytes():
+    """
+    このプロセスの常駐メモリ．Linux は /proc，それ以外は psutil，なければ
+    resource の最大値で代用し，どれも使えなければ None（Windows に resource はない）．
+    """
+    try:
+        import resource
+    except ImportError:
+        resource = None
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * resource.getpagesize()
+    except (OSError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        pass
+    if resource is None:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss は macOS ではバイト，Linux などでは KB
+    return maxrss if sys.platform == "darwin" else maxrss * 1024
+
+
+def memory_report():
+    """{"pyplot": pyplot に登録された図の数, "open": 閉じていない図の数, "rss": バイト数 (不明なら None)}"""
+    return {"pyplot": len(plt.get_fignums()), "open": len(_open_figures), "rss": rss_bytes()}
+
+
+def show_memory_report(container=None):
+    report = memory_report()
+    rss = "不明" if report["rss"] is None else f"{report['rss'] / 2 ** 20:.0f}MB"
+    (container or st.sidebar).caption(f"図 pyplot {report['pyplot']} / 未close {report['open']}　RSS {rss}")
+
+
+# -------------------- 全マッチングを 1 枚に -------------------- #
+# 配置は各アプリの draw_matching_with_images と同じ（男性は左，女性は右に縦に並ぶ）
+SPACING = 0.3
+X_MEN, X_WOMEN = 0.2, 0.8
+ICON_HALF_W = 0.10
+ICON_HALF_H = 36 * 0.5 / 45 * 0.25
+
+
+def _panel_ylim(n):
+    return -(n - 1) * SPACING - 0.3, 0.3
+
+
+@lru_cache(maxsize=16)
+def _background(men, women, image_dir, px_per_unit=400):
+    """
+    アイコンだけを並べた透明な背景（全パネル共通）．パネルと同じ範囲
+    x: 0〜1, y: _panel_ylim を覆う RGBA 配列で，各パネルには imshow 1 回で重ねる．
+    """
+    y_min, y_max = _panel_ylim(len(men))
+    width = px_per_unit
+    height = round((y_max - y_min) * px_per_unit)
+    canvas = np.zeros((height, width, 4), dtype=np.uint8)
+    icon_w = round(2 * ICON_HALF_W * px_per_unit)
+    icon_h = round(2 * ICON_HALF_H * px_per_unit)
+    _, sprites = atlas((icon_w, icon_h), image_dir)
+    for names, x in ((men, X_MEN), (women, X_WOMEN)):
+        for k, name in enumerate(names):
+            img = sprites.get(name)
+            if img is None:
+                continue
+            left = round((x - ICON_HALF_W) * px_per_unit)
+            top = round((y_max - (-k * SPACING + ICON_HALF_H)) * px_per_unit)
+            canvas[top:top + icon_h, left:left + icon_w] = img
+    canvas.flags.writeable = False
+    return canvas
+
+
+def draw_matching_grid(matchings, men, women, men_prefs, women_prefs, titles=None, ncols=3,
+                       panel_size=(2.4, 2.2), dpi=100, image_dir=IMAGE_DIR):
+    """
+    安定マッチングの一覧を 1 枚の図（パネルの格子）に描く．アイコンは共通の背景
+    （_background）を重ねるだけにして，パネルごとに描くのは辺と満足度の表示のみ．
+    matchings は [(m, w), ...] のリスト，men / women は名前の並び（上から順）．
+    """
+    n = len(men)
+    top = n - 1
+    count = len(matchings)
+    ncols = max(1, min(ncols, count))
+    nrows = max(1, math.ceil(count / ncols))
+    fig, axes = subplots(figsize=(panel_size[0] * ncols, panel_size[1] * nrows), dpi=dpi,
+                         nrows=nrows, ncols=ncols, squeeze=False)
+    background = _background(tuple(men), tuple(women), image_dir)
+    y_min, y_max = _panel_ylim(n)
+    men_y = {m: -k * SPACING for k, m in enumerate(men)}
+    women_y = {w: -k * SPACING for k, w in enumerate(women)}
+    for k, ax in enumerate(axes.flat):
+        ax.axis("off")
+        if k >= count:
+            continue
+        for m, w in matchings[k]:
+            y_m, y_w = men_y[m], women_y[w]
+            ax.plot([X_MEN, X_WOMEN], [y_m, y_w], "k-", lw=1.2, zorder=1)
+            ax.text(X_MEN - ICON_HALF_W - 0.02, y_m, f"({top - men_prefs[m].index(w)}) {m}",
+                    va="center", ha="right", fontsize=8, zorder=3)
+            ax.text(X_WOMEN + ICON_HALF_W + 0.02, y_w, f"({top - women_prefs[w].index(m)}) {w}",
+                    va="center", ha="left", fontsize=8, zorder=3)
+        ax.imshow(background, extent=(0, 1, y_min, y_max), zorder=2)
+        ax.set_xlim(0, 1)
+        ax.set_ylim(y_min, y_max)
+        if titles is not None:
+            # set_title は描くたびに位置を計算し直して遅いので，ただの文字として置く
+            ax.text(0.5, y_max, titles[k], ha="center", va="bottom", fontsize=9)
+    fig.subplots_adjust(top=0.92 if titles is not None else 1, bottom=0, left=0, right=1, hspace=0.25, wspace=0)
+    return fig
+
+
+# -------------------- 書き出し -------------------- #
+def dpi_for(fig, display_width, pixel_ratio=PIXEL_RATIO):
+    """表示幅 display_width (CSS ピクセル) にちょうどよい dpi"""
+    return max(display_width * pixel_ratio / fig.get_figwidth(), 1)
+
+
+def figure_bytes(fig, fmt="png", display_width=700, close=True):
+    """
+    図を fmt ("png" / "webp" / "svg") のバイト列にする．
+    ラスタ形式の解像度は display_width から決める（SVG は解像度に依らない）．
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"fmt は {FORMATS} のどれか ({fmt!r})")
+    buf = io.BytesIO()
+    if fmt == "svg":
+        fig.savefig(buf, format="svg", bbox_inches="tight")
+    else:
+        fig.savefig(buf, format="png", bbox_inches="tight", dpi=dpi_for(fig, display_width))
+        if fmt == "webp":
+            png = buf
+            png.seek(0)
+            buf = io.BytesIO()
+            with Image.open(png) as img:
+                img.save(buf, format="WEBP", quality=WEBP_QUALITY, method=6)
+    if close:
+        close_figure(fig)
+    return buf.getvalue()
+
+
+class FigureBudget:
+    """
+    1 ページで送った図のバイト数を記録する．
+      budget = FigureBudget(limit=2_000_000)
+      show_figure(data, "webp", budget, "(i)")
+      budget.report()                # ページの最後に合計と図ごとの内訳を表示
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.sizes = []          # [(名前, 形式, バイト数), ...]
+
+    def add(self, name, fmt, nbytes):
+        self.sizes.append((name, fmt, nbytes))
+
+    @property
+    def total(self):
+        return sum(n for _, _, n in self.sizes)
+
+    @property
+    def over(self):
+        return self.limit is not None and self.total > self.limit
+
+    def report(self, container=None):
+        container = container or st.sidebar
+        if not self.sizes:
+            return
+        detail = ", ".join(f"{name} {nbytes / 1024:.0f}KB" for name, _, nbytes in self.sizes)
+        limit = f" / 上限 {self.limit / 1024:.0f}KB" if self.limit is not None else ""
+        text = f"図の送信量 {self.total / 1024:.0f}KB{limit}（{detail}）"
+        if self.over:
+            container.warning(text)
+        else:
+            container.caption(text)
+
+
+def show_figure(data, fmt, budget=None, name="", container=None):
+    """
+    figure_bytes の結果を表示し，budget があれば送信量を記録する．
+    st.image は PNG / JPEG 以外を PNG か JPEG に変換し直すので，WebP と SVG は
+    data URI のまま渡す（base64 の分だけ増えた大きさを送信量として記録する）．
+    """
+    container = container or st
+    if fmt == "png":
+        container.image(data, use_container_width=True, output_format="PNG")
+        sent = len(data)
+    else:
+        mime = "image/svg+xml" if fmt == "svg" else "image/webp"
+        uri = f"data:{mime};base64,{base64.b64encode(data).decode('ascii')}"
+        container.image(uri, use_container_width=True)
+        sent = len(uri)
+    if budget is not None:
+        budget.add(name, fmt, sent)
+    return sent
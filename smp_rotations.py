@@ -0,0 +1,344 @@
+# ローテーション半順序による安定マッチング列挙 (Gusfield-Irving)
+#
+# 安定マッチング全体は，男性最適マッチングから「ローテーション」を
+# 順に除去していくことで得られる．ローテーション同士の前後関係（半順序）の
+# 閉じた部分集合（イデアル）と安定マッチングは 1 対 1 に対応するので，
+# n! 通りの順列を調べなくても全安定マッチングを多項式遅延で列挙できる．
+#
+# 番号はすべて PreferenceProfile の整数インデックス（男性 i, 女性 j）で扱う．
+
+import math
+import random
+
+
+# -------------------- ローテーション半順序 -------------------- #
+class RotationPoset:
+    """
+    rotations[r]  : ローテーション r = ((m0, w0), (m1, w1), ..., (mk-1, wk-1))
+                    除去すると男性 m_t の相手が w_t から w_{t+1} に移る
+    preds[r]      : r より先に除去しなければならないローテーションの番号
+    succs[r]      : preds の逆向き
+    deltas[r]     : r を除去したときの (男性の順位和の増分, 女性の順位和の増分)
+    base          : 男性最適マッチングの (男性の順位和, 女性の順位和)
+    rotations は除去した順に並んでいるので，番号順がそのまま位相順になる．
+    順位和はローテーションごとに足し算で変わるので，どの安定マッチングの
+    男性和・女性和・満足度合計も base + (イデアルの deltas の和) で求まる．
+    """
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.n = profile.n
+        self.man_optimal = profile.man_optimal()
+        self.woman_optimal = profile.woman_optimal()
+        self.rotations = _find_rotations(profile, self.man_optimal, self.woman_optimal)
+        self.preds = _precedence(profile, self.man_optimal, self.rotations)
+        self.succs = [[] for _ in self.rotations]
+        for r, ps in enumerate(self.preds):
+            for p in ps:
+                self.succs[p].append(r)
+        self.deltas = [_rotation_deltas(profile, rot) for rot in self.rotations]
+        men_rank, women_rank = profile.men_rank, profile.women_rank
+        self.base = (sum(men_rank[i][j] for i, j in enumerate(self.man_optimal)),
+                     sum(women_rank[j][i] for i, j in enumerate(self.man_optimal)))
+
+    def __len__(self):
+        return len(self.rotations)
+
+    def apply(self, wives, r):
+        """wives にローテーション r を除去した結果を書き込む（その場で更新）"""
+        rot = self.rotations[r]
+        k = len(rot)
+        for t in range(k):
+            wives[rot[t][0]] = rot[(t + 1) % k][1]
+
+    def undo(self, wives, r):
+        for m, w in self.rotations[r]:
+            wives[m] = w
+
+    def rank_sums(self, ideal):
+        """イデアルに対応するマッチングの (男性の順位和, 女性の順位和)．O(|ideal|)"""
+        ms, ws = self.base
+        for r in ideal:
+            d_men, d_women = self.deltas[r]
+            ms += d_men
+            ws += d_women
+        return ms, ws
+
+    def matching_of(self, ideal):
+        """イデアル（除去済みローテーションの集合）に対応するマッチング (wives)"""
+        wives = list(self.man_optimal)
+        for r in sorted(ideal):
+            self.apply(wives, r)
+        return wives
+
+    def ideal_of(self, wives):
+        """
+        安定マッチング wives で除去済みのローテーション番号の集合を O(k) で返す．
+        r の先頭の男性が w_1 以降の相手と組んでいれば r は除去済み．
+        """
+        men_rank = self.profile.men_rank
+        ideal = set()
+        for r, rot in enumerate(self.rotations):
+            m = rot[0][0]
+            if men_rank[m][wives[m]] >= men_rank[m][rot[1][1]]:
+                ideal.add(r)
+        return frozenset(ideal)
+
+    def iter_ideals(self):
+        """
+        すべてのイデアルを除去済みローテーション番号の集合として列挙する．
+        位相順に「除去する / しない」を決めていき，しない場合は後続もすべて
+        除去不可にする．どの分岐も必ず 1 つ以上の解に至るので遅延は多項式．
+        """
+        for taken, _ in self._walk(None):
+            yield frozenset(r for r in range(len(self.rotations)) if taken[r] == 1)
+
+    def iter_matchings(self):
+        """すべての安定マッチングを wives リストとして列挙する（多項式遅延）"""
+        wives = list(self.man_optimal)
+        for _, current in self._walk(wives):
+            yield list(current)
+
+    # ---------- 個数 ---------- #
+    def count_ideals(self, max_states=100000):
+        """
+        イデアル（= 安定マッチング）の個数を列挙せずに数える．
+        極小元 x について「x を含む」= x を除いた半順序のイデアル，
+        「x を含まない」= x の上側をすべて除いた半順序のイデアル，と分け，
+        連結成分ごとの積に分解しながら残りの集合（ビット列）でメモ化する．
+        メモが max_states を超えたら None を返す（estimate_ideals を使う）．
+        """
+        k = len(self.rotations)
+        pred_mask = [sum(1 << p for p in ps) for ps in self.preds]
+        nbr = [pred_mask[r] | sum(1 << s for s in self.succs[r]) for r in range(k)]
+        up = [0] * k
+        for r in reversed(range(k)):
+            up[r] = 1 << r
+            for s in self.succs[r]:
+                up[r] |= up[s]
+
+        memo = {0: 1}
+        stack = [((1 << k) - 1, None)]
+        while stack:
+            mask, parts = stack.pop()
+            if mask in memo:
+                continue
+            if parts is not None:
+                # 子がすべて数え終わったので組み立てる
+                kind, children = parts
+                if kind == "product":
+                    memo[mask] = math.prod(memo[c] for c in children)
+                else:
+                    memo[mask] = memo[children[0]] + memo[children[1]]
+                continue
+            if len(memo) > max_states:
+                return None
+            components = _components(mask, nbr)
+            if len(components) > 1:
+                parts = ("product", components)
+            else:
+                # 上側が大きい極小元で分けると「含まない」側が小さくなる
+                x = max((r for r in _bits(mask) if not pred_mask[r] & mask),
+                        key=lambda r: bin(up[r] & mask).count("1"))
+                parts = ("sum", [mask & ~(1 << x), mask & ~up[x]])
+            stack.append((mask, parts))
+            stack.extend((c, None) for c in parts[1] if c not in memo)
+        return memo[(1 << k) - 1]
+
+    def estimate_ideals(self, samples=1000, seed=None):
+        """
+        イデアルの個数を Knuth の推定法で見積もる．(推定値, 標準誤差) を返す．
+        iter_ideals と同じ分岐を無作為に 1 本たどり，2 択だった回数を c として
+        2^c を 1 サンプルとする（その平均は個数の不偏推定量）．
+        分布の裾が重いので，サンプルが少ないと過小評価になりやすい．
+        """
+        rng = random.Random(seed)
+        k = len(self.rotations)
+        values = []
+        for _ in range(samples):
+            taken = [False] * k
+            choices = 0
+            for r in range(k):
+                if all(taken[p] for p in self.preds[r]):
+                    choices += 1
+                    taken[r] = rng.random() < 0.5
+            values.append(2 ** choices)
+        mean = sum(values) / samples
+        if samples < 2:
+            return mean, math.inf
+        var = sum((v - mean) ** 2 for v in values) / (samples - 1)
+        return mean, math.sqrt(var / samples)
+
+    def _walk(self, wives):
+        # taken[r]: 1 = 除去済み, -1 = 除去しない, 0 = 未決定
+        # 先行のどれかが除去されていなければ r も除去できない
+        k = len(self.rotations)
+        taken = [0] * k
+        # スタックの各要素: (r, 状態)  0 = 未訪問, 1 = 除去した枝から戻った, 2 = 後始末のみ
+        stack = [(0, 0)]
+        while stack:
+            r, state = stack.pop()
+            if r == k:
+                yield taken, wives
+            elif state == 0:
+                if all(taken[p] == 1 for p in self.preds[r]):
+                    taken[r] = 1
+                    if wives is not None:
+                        self.apply(wives, r)
+                    stack.append((r, 1))
+                else:
+                    taken[r] = -1
+                    stack.append((r, 2))
+                stack.append((r + 1, 0))
+            elif state == 1:
+                # 除去した枝を戻して，除去しない枝へ
+                if wives is not None:
+                    self.undo(wives, r)
+                taken[r] = -1
+                stack.append((r, 2))
+                stack.append((r + 1, 0))
+            else:
+                taken[r] = 0
+
+
+def _bits(mask):
+    r = 0
+    while mask:
+        if mask & 1:
+            yield r
+        mask >>= 1
+        r += 1
+
+
+def _components(mask, nbr):
+    # mask 内の要素を（比較可能性の）連結成分ごとのビット列に分ける
+    components = []
+    rest = mask
+    while rest:
+        seed = rest & -rest
+        comp = seed
+        frontier = seed
+        while frontier:
+            low = frontier & -frontier
+            frontier ^= low
+            new = nbr[low.bit_length() - 1] & mask & ~comp
+            comp |= new
+            frontier |= new
+        components.append(comp)
+        rest &= ~comp
+    return components
+
+
+# -------------------- ローテーションの探索 -------------------- #
+def _find_rotations(profile, man_optimal, woman_optimal):
+    """
+    男性最適から女性最適まで，露出したローテーションを順に除去しながら
+    すべてのローテーションを求める．各男性の好みリスト上のポインタは
+    前にしか進まないので全体で O(n^2)．
+    """
+    n = profile.n
+    men_pref, men_rank, women_rank = profile.men_pref, profile.men_rank, profile.women_rank
+    wives = list(man_optimal)
+    husbands = [0] * n
+    for i, j in enumerate(wives):
+        husbands[j] = i
+    ptr = [men_rank[i][wives[i]] + 1 for i in range(n)]
+
+    def next_woman(i):
+        # 今の相手より i を好む女性が見つかるまで好みリストを進める
+        pref, p = men_pref[i], ptr[i]
+        while True:
+            j = pref[p]
+            if women_rank[j][i] < women_rank[j][husbands[j]]:
+                ptr[i] = p
+                return j
+            p += 1
+
+    rotations = []
+    stack = []
+    on_stack = [False] * n
+    start = 0
+    while True:
+        if not stack:
+            while start < n and wives[start] == woman_optimal[start]:
+                start += 1
+            if start == n:
+                break
+            stack.append(start)
+            on_stack[start] = True
+        nxt = husbands[next_woman(stack[-1])]
+        if not on_stack[nxt]:
+            stack.append(nxt)
+            on_stack[nxt] = True
+            continue
+        # スタック上で閉路が見つかった → ローテーション
+        cycle = []
+        while True:
+            m = stack.pop()
+            on_stack[m] = False
+            cycle.append(m)
+            if m == nxt:
+                break
+        cycle.reverse()
+        rot = tuple((m, wives[m]) for m in cycle)
+        rotations.append(rot)
+        k = len(rot)
+        for t in range(k):
+            m, w = rot[t][0], rot[(t + 1) % k][1]
+            wives[m] = w
+            husbands[w] = m
+            ptr[m] = men_rank[m][w] + 1
+    return rotations
+
+
+def _rotation_deltas(profile, rot):
+    men_rank, women_rank = profile.men_rank, profile.women_rank
+    k = len(rot)
+    d_men = 0
+    d_women = 0
+    for t in range(k):
+        m, w = rot[t]
+        m_next, w_next = rot[(t + 1) % k]
+        d_men += men_rank[m][w_next] - men_rank[m][w]
+        d_women += women_rank[w_next][m] - women_rank[w_next][m_next]
+    return d_men, d_women
+
+
+def _precedence(profile, man_optimal, rotations):
+    """
+    ローテーション間の直接の先行関係を O(n^2) で作る．
+      (a) 男性 m を w に移したローテーション → m を w から動かすローテーション
+      (b) ローテーション r で m が w_t から w_{t+1} へ移るとき，その間にある
+          女性 w' を「m より好きな相手」に移したローテーション → r
+    """
+    n = profile.n
+    men_pref, men_rank, women_rank = profile.men_pref, profile.men_rank, profile.women_rank
+    # moved_by[j][r_pos]: 女性 j の相手が順位 r_pos 以上になった最初のローテーション
+    partner_rank = [0] * n
+    for i, j in enumerate(man_optimal):
+        partner_rank[j] = women_rank[j][i]
+    moved_by = [[-1] * n for _ in range(n)]
+    last_of_man = [-1] * n
+    preds = [set() for _ in rotations]
+    for r, rot in enumerate(rotations):
+        k = len(rot)
+        for t in range(k):
+            m, w = rot[t]
+            w_next = rot[(t + 1) % k][1]
+            if last_of_man[m] >= 0:
+                preds[r].add(last_of_man[m])
+            last_of_man[m] = r
+            for w_skip in men_pref[m][men_rank[m][w] + 1:men_rank[m][w_next]]:
+                label = moved_by[w_skip][women_rank[w_skip][m]]
+                if label >= 0:
+                    preds[r].add(label)
+        # r で女性の相手が良くなった分だけラベルを付ける
+        for t in range(k):
+            m = rot[t][0]
+            w_next = rot[(t + 1) % k][1]
+            new_rank = women_rank[w_next][m]
+            labels = moved_by[w_next]
+            for pos in range(new_rank, partner_rank[w_next]):
+                labels[pos] = r
+            partner_rank[w_next] = new_rank
+    return [sorted(p) for p in preds]
@@ -0,0 +1,323 @@
+# 指標ごとの最適安定マッチングを列挙なしで求めるソルバ
+#
+# どの安定マッチングも「男性最適マッチング + 除去したローテーションの集合（イデアル）」
+# で表せるので，指標の最適化はローテーション半順序上の最適化に置き換えられる．
+
+import time
+from collections import deque
+
+
+# -------------------- 満足度合計 最大 (egalitarian) -------------------- #
+def egalitarian_matching(profile):
+    """
+    満足度合計が最大（= 順位の和が最小）の安定マッチング (wives) を返す．
+    重みが負（除去すると得をする）のローテーションをなるべく多く，先行関係を
+    保ったまま選ぶ問題は最大重み閉包問題になり，最小カット 1 回で解ける．
+    """
+    poset = profile.rotations()
+    gains = [-(d_men + d_women) for d_men, d_women in poset.deltas]
+    ideal = max_weight_closure(gains, poset.preds)
+    return poset.matching_of(ideal)
+
+
+# -------------------- 最小 最大 (minimum regret) -------------------- #
+def minimum_regret_matching(profile):
+    """
+    最も不満な人の順位（regret）が最小の安定マッチング (wives) と，その
+    「最小」の満足度 (n - 1 - regret) を返す．O(n^2)
+
+    男性最適から出発し，最悪の人が女性である限り，その女性の相手を良くする
+    ローテーションを（未除去の先行と一緒に）除去していく．男性の最悪順位は
+    除去のたびに悪化する一方なので，最悪の人が男性になった時点で打ち切れる．
+    """
+    n = profile.n
+    if n == 0:
+        return [], 0
+    poset = profile.rotations()
+    men_rank, women_rank = profile.men_rank, profile.women_rank
+    wives = list(poset.man_optimal)
+    husbands = [0] * n
+    for i, j in enumerate(wives):
+        husbands[j] = i
+
+    # 男性の最悪順位は上がる一方なので最大値だけ持てばよい．女性は順位ごとの集合で持つ
+    men_max = max(men_rank[i][j] for i, j in enumerate(wives))
+    women_at = [set() for _ in range(n)]
+    for i, j in enumerate(wives):
+        women_at[women_rank[j][i]].add(j)
+    women_max = max(r for r in range(n) if women_at[r])
+
+    # 女性ごとに，その女性の相手を替えるローテーションを除去順に並べる
+    moves = [[] for _ in range(n)]
+    for r, rot in enumerate(poset.rotations):
+        for _, w in rot:
+            moves[w].append(r)
+    next_move = [0] * n
+    taken = [False] * len(poset)
+
+    def eliminate(r):
+        # 除去後の男性の順位の最大を返す
+        rot = poset.rotations[r]
+        k = len(rot)
+        worst = 0
+        for t in range(k):
+            m, w = rot[t][0], rot[(t + 1) % k][1]
+            women_at[women_rank[w][husbands[w]]].discard(w)
+            women_at[women_rank[w][m]].add(w)
+            worst = max(worst, men_rank[m][w])
+        for t in range(k):
+            m, w = rot[t][0], rot[(t + 1) % k][1]
+            wives[m] = w
+            husbands[w] = m
+            next_move[w] += 1
+        taken[r] = True
+        return worst
+
+    best, best_wives = max(men_max, women_max), list(wives)
+    while women_max > men_max:
+        w = next(iter(women_at[women_max]))
+        if next_move[w] == len(moves[w]):
+            break
+        # 先行も含めて未除去のローテーションを集め，位相順に除去する
+        closure = set()
+        stack = [moves[w][next_move[w]]]
+        while stack:
+            r = stack.pop()
+            if r in closure or taken[r]:
+                continue
+            closure.add(r)
+            stack.extend(poset.preds[r])
+        for r in sorted(closure):
+            men_max = max(men_max, eliminate(r))
+        while not women_at[women_max]:
+            women_max -= 1
+        if max(men_max, women_max) < best:
+            best, best_wives = max(men_max, women_max), list(wives)
+    return best_wives, n - 1 - best
+
+
+# -------------------- 差 最小 (sex-equal) -------------------- #
+def sex_equal_matching(profile, time_limit=None):
+    """
+    男性和と女性和の差が最小の安定マッチングを分枝限定法で探す．
+    (wives, 差, gap) を返す．gap は「見つけた差 - 証明済みの下界」で，
+    最後まで探索できれば 0．time_limit 秒を超えたらその時点の最良解を返す．
+
+    ローテーション r を除去すると d = 男性順位和 - 女性順位和 は
+    δ(r) = Δ男性 - Δ女性 > 0 だけ必ず増える．したがって部分解から到達できる d は
+    [今の d, 今の d + 除去可能な残りの δ の和] に収まり，これが限定に使える下界になる．
+    """
+    poset = profile.rotations()
+    k = len(poset)
+    preds, succs = poset.preds, poset.succs
+    delta = [d_men - d_women for d_men, d_women in poset.deltas]
+    ms, ws = poset.base
+    deadline = None if time_limit is None else time.perf_counter() + time_limit
+
+    taken = [0] * k         # 1 = 除去, -1 = 除去しない, 0 = 未決定
+    blocked = [0] * k       # 除去しないと決めた先行（の先行）の数
+    state = {"d": ms - ws, "avail": sum(delta)}
+
+    def lower_bound():
+        lo = state["d"]
+        hi = lo + state["avail"]
+        return lo if lo >= 0 else (-hi if hi <= 0 else 0)
+
+    def block(r, step):
+        # r を除去しないと決めた / 戻したときに，後続の除去可能性を更新する
+        stack = [r]
+        while stack:
+            u = stack.pop()
+            for v in succs[u]:
+                blocked[v] += step
+                if taken[v] == 0 and blocked[v] == (1 if step > 0 else 0):
+                    state["avail"] -= step * delta[v]
+                    stack.append(v)
+
+    def choose(r, take):
+        state["avail"] -= delta[r]
+        if take:
+            taken[r] = 1
+            state["d"] += delta[r]
+        else:
+            taken[r] = -1
+            block(r, 1)
+
+    def unchoose(r):
+        if taken[r] == 1:
+            state["d"] -= delta[r]
+        else:
+            block(r, -1)
+        taken[r] = 0
+        state["avail"] += delta[r]
+
+    best = [None, None]     # [|d|, ideal]
+
+    def record(value, fill):
+        if best[0] is None or value < best[0]:
+            ideal = {r for r in range(k) if taken[r] == 1}
+            if fill:
+                ideal |= {r for r in range(k) if taken[r] == 0 and blocked[r] == 0}
+            best[0], best[1] = value, ideal
+
+    # スタックの要素: (r, 段階, 2つ目の枝の下界)  段階 0 = 到着, 1 = 2つ目の枝へ, 2 = 戻す
+    record(abs(state["d"]), False)
+    stack = [(0, 0, 0)]
+    nodes = 0
+    timed_out = False
+    while stack:
+        r, phase, bound = stack.pop()
+        if phase == 2:
+            unchoose(r)
+            continue
+        if phase == 1:
+            first = taken[r] == 1
+            unchoose(r)
+            choose(r, not first)
+            if lower_bound() >= best[0]:
+                unchoose(r)
+                continue
+            stack.append((r, 2, bound))
+            stack.append((r + 1, 0, 0))
+            continue
+        nodes += 1
+        if deadline is not None and nodes % 1024 == 0 and time.perf_counter() > deadline:
+            stack.append((r, phase, bound))
+            timed_out = True
+            break
+        lo = state["d"]
+        hi = lo + state["avail"]
+        if lo >= 0 or r == k:
+            # これ以上除去しても差は広がるだけ
+            record(abs(lo), False)
+            continue
+        if hi <= 0:
+            # 除去できるものを全部除去するのが最善
+            record(-hi, True)
+            continue
+        if best[0] == 0:
+            continue
+        while r < k and taken[r] == 0 and blocked[r] > 0:
+            r += 1
+        if r == k:
+            record(abs(lo), False)
+            continue
+        # d < 0 なので除去する枝から試す．除去しない枝の下界（緩め）も控えておく
+        hi_without = hi - delta[r]
+        choose(r, True)
+        stack.append((r, 1, -hi_without if hi_without <= 0 else 0))
+        stack.append((r + 1, 0, 0))
+
+    gap = 0
+    if timed_out:
+        pending = [b for _, phase, b in stack if phase == 1]
+        lower = min(pending + [lower_bound(), best[0]])
+        gap = best[0] - lower
+    return poset.matching_of(best[1]), best[0], gap
+
+
+def max_weight_closure(gains, preds):
+    """
+    先行関係 preds に閉じた集合のうち gains の和が最大のものを返す．
+    s → r (利得 > 0), r → t (利得 < 0), r → 先行 (容量無限) のネットワークで
+    最小カットを取ると s 側が最適な閉包になる．
+    """
+    k = len(gains)
+    source, sink = k, k + 1
+    flow = _Dinic(k + 2)
+    inf = sum(abs(g) for g in gains) + 1
+    for r, g in enumerate(gains):
+        if g > 0:
+            flow.add_edge(source, r, g)
+        elif g < 0:
+            flow.add_edge(r, sink, -g)
+        for p in preds[r]:
+            flow.add_edge(r, p, inf)
+    flow.max_flow(source, sink)
+    reach = flow.reachable(source)
+    return {r for r in range(k) if reach[r]}
+
+
+class _Dinic:
+    """最小カット用の最大流 (Dinic 法)"""
+
+    def __init__(self, n):
+        self.graph = [[] for _ in range(n)]
+        self.to = []
+        self.cap = []
+
+    def add_edge(self, u, v, c):
+        self.graph[u].append(len(self.to))
+        self.to.append(v)
+        self.cap.append(c)
+        self.graph[v].append(len(self.to))
+        self.to.append(u)
+        self.cap.append(0)
+
+    def _levels(self, s):
+        level = [-1] * len(self.graph)
+        level[s] = 0
+        queue = deque([s])
+        while queue:
+            u = queue.popleft()
+            for e in self.graph[u]:
+                v = self.to[e]
+                if self.cap[e] > 0 and level[v] < 0:
+                    level[v] = level[u] + 1
+                    queue.append(v)
+        return level
+
+    def max_flow(self, s, t):
+        total = 0
+        while True:
+            level = self._levels(s)
+            if level[t] < 0:
+                return total
+            it = [0] * len(self.graph)
+            while True:
+                pushed = self._augment(s, t, level, it)
+                if not pushed:
+                    break
+                total += pushed
+
+    def _augment(self, s, t, level, it):
+        # 再帰を使わずに 1 本の増加路を探して流す
+        path = []
+        u = s
+        while u != t:
+            edges = self.graph[u]
+            while it[u] < len(edges):
+                e = edges[it[u]]
+                v = self.to[e]
+                if self.cap[e] > 0 and level[v] == level[u] + 1:
+                    break
+                it[u] += 1
+            else:
+                if not path:
+                    return 0
+                # 行き止まり: 1 つ戻る
+                level[u] = -1
+                e = path.pop()
+                u = self.to[e ^ 1]
+                it[u] += 1
+                continue
+            path.append(e)
+            u = self.to[e]
+        pushed = min(self.cap[e] for e in path)
+        for e in path:
+            self.cap[e] -= pushed
+            self.cap[e ^ 1] += pushed
+        return pushed
+
+    def reachable(self, s):
+        seen = [False] * len(self.graph)
+        seen[s] = True
+        stack = [s]
+        while stack:
+            u = stack.pop()
+            for e in self.graph[u]:
+                v = self.to[e]
+                if self.cap[e] > 0 and not seen[v]:
+                    seen[v] = True
+                    stack.append(v)
+        return seen
@@ -0,0 +1,175 @@
+# Streamlit のセッションをまたいだキャッシュ
+#
+# 授業で全員が同じプリセットを開くと，サーバは同じ計算と描画を人数分くり返す．
+# ここでは計算（安定マッチングの一覧と指標）と描画（マッチング図の画像）を
+# st.cache_data で包み，どのセッションからでも同じ結果を使い回す．
+# キーには好みを不変なタプルにしたもの（profile_key）を使う．
+# st.cache_data は当たり外れを教えてくれないので，関数の本体（= 外れたときだけ
+# 実行される）で数を数えて hit 率を出す．
+
+import threading
+
+import streamlit as st
+
+from smp_altair import chart_spec
+from smp_assets import IMAGE_DIR, preload
+from smp_cache import ResultCache
+from smp_core import PreferenceProfile
+from smp_solvers import egalitarian_matching, minimum_regret_matching, sex_equal_matching
+from smp_render import figure_bytes
+
+MAX_ENTRIES = 256       # 関数ごとに保持する結果の数
+TTL = 60 * 60           # 秒
+
+_stats = {}             # {名前: [呼び出し回数, 計算した回数]}
+_stats_lock = threading.Lock()
+
+
+def _count(name, miss):
+    with _stats_lock:
+        calls = _stats.setdefault(name, [0, 0])
+        calls[miss] += 1
+
+
+def profile_key(men_prefs, women_prefs):
+    """好みの dict をキャッシュのキーに使える不変なタプルにする（名前の順も含む）"""
+    return (tuple((m, tuple(p)) for m, p in men_prefs.items()),
+            tuple((w, tuple(p)) for w, p in women_prefs.items()))
+
+
+def profile_from_key(key):
+    men, women = key
+    return PreferenceProfile({m: list(p) for m, p in men}, {w: list(p) for w, p in women})
+
+
+@st.cache_resource
+def result_cache():
+    """ディスクキャッシュ（smp_cache）はプロセスに 1 つ"""
+    return ResultCache()
+
+
+@st.cache_resource(show_spinner=False)
+def preload_icons(image_dir=IMAGE_DIR):
+    """
+    全アイコンを全サイズで読み込んで縮小しておく．各アプリの起動時に呼ぶ．
+    st.cache_resource なので，再実行やセッションが変わっても読み込みはプロセスで 1 回だけ．
+    """
+    preload(image_dir)
+    return True
+
+
+# -------------------- 計算 -------------------- #
+def analysis(key):
+    """
+    安定マッチングの一覧 [(m, w), ...] のリストと指標の表を返す．
+    メモリ（全セッション共通）→ ディスク → 計算 の順に探す．
+    """
+    _count("analysis", 0)
+    return _analysis(key)
+
+
+@st.cache_data(max_entries=MAX_ENTRIES, ttl=TTL, show_spinner=False)
+def _analysis(key):
+    _count("analysis", 1)
+    profile = profile_from_key(key)
+    result = result_cache().analysis(profile)
+    return [profile.to_pairs(w) for w in result["matchings"]], result["satisfaction"]
+
+
+def lattice_dot(key, labels):
+    """安定マッチングの束（Hasse 図）の DOT 文字列"""
+    _count("lattice_dot", 0)
+    return _lattice_dot(key, tuple(labels))
+
+
+@st.cache_data(max_entries=MAX_ENTRIES, ttl=TTL, show_spinner=False)
+def _lattice_dot(key, labels):
+    _count("lattice_dot", 1)
+    return profile_from_key(key).lattice().to_dot(list(labels))
+
+
+def optimal_matchings(key, time_limit=1.0):
+    """
+    列挙を使わずに求めた指標ごとの最適安定マッチング．
+    {"total": (ペア列, 満足度合計), "min": (ペア列, 最小), "equal": (ペア列, 差, 最適値との差の上限)}
+    """
+    _count("optimal_matchings", 0)
+    return _optimal_matchings(key, time_limit)
+
+
+@st.cache_data(max_entries=MAX_ENTRIES, ttl=TTL, show_spinner=False)
+def _optimal_matchings(key, time_limit):
+    _count("optimal_matchings", 1)
+    profile = profile_from_key(key)
+    best_total = egalitarian_matching(profile)
+    best_min, best_min_value = minimum_regret_matching(profile)
+    best_equal, best_equal_value, gap = sex_equal_matching(profile, time_limit=time_limit)
+    return {
+        "total": (profile.to_pairs(best_total), profile.satisfaction(best_total)[0]),
+        "min": (profile.to_pairs(best_min), best_min_value),
+        "equal": (profile.to_pairs(best_equal), best_equal_value, gap),
+    }
+
+
+def gs_trace(key, women_propose=False):
+    """受入保留の記録（smp_trace.GSTrace）．好み 1 組につき 1 回だけ走らせる"""
+    _count("gs_trace", 0)
+    return _gs_trace(key, women_propose)
+
+
+@st.cache_data(max_entries=MAX_ENTRIES, ttl=TTL, show_spinner=False)
+def _gs_trace(key, women_propose):
+    _count("gs_trace", 1)
+    return profile_from_key(key).gs_trace(women_propose)
+
+
+# -------------------- 描画 -------------------- #
+def figure(name, key, matching, draw, fmt="png", display_width=700):
+    """
+    draw(matching, men_prefs, women_prefs) で描いた図を fmt のバイト列で返す
+    （smp_render.figure_bytes で表示幅に合わせて書き出す）．
+    name は描画関数ごとに別の名前を付ける（関数そのものはキーに含めない）．
+    """
+    _count(name, 0)
+    return _figure(name, key, tuple(map(tuple, matching)), fmt, display_width, draw)
+
+
+@st.cache_data(max_entries=MAX_ENTRIES, ttl=TTL, show_spinner=False)
+def _figure(name, key, matching, fmt, display_width, _draw):
+    _count(name, 1)
+    men, women = key
+    fig = _draw(list(matching), {m: list(p) for m, p in men}, {w: list(p) for w, p in women})
+    return figure_bytes(fig, fmt, display_width)
+
+
+def chart(name, key, matching, build):
+    """
+    build(matching, men_prefs, women_prefs) で組んだ Altair のグラフを
+    Vega-Lite の仕様（dict）で返す．ブラウザで描くので，サーバは仕様を作るだけ．
+    """
+    _count(name, 0)
+    return _chart(name, key, tuple(map(tuple, matching)), build)
+
+
+@st.cache_data(max_entries=MAX_ENTRIES, ttl=TTL, show_spinner=False)
+def _chart(name, key, matching, _build):
+    _count(name, 1)
+    men, women = key
+    return chart_spec(_build(list(matching), {m: list(p) for m, p in men}, {w: list(p) for w, p in women}))
+
+
+def cache_stats():
+    """{名前: (呼び出し回数, hit 数, hit 率)}"""
+    with _stats_lock:
+        return {name: (calls, calls - misses, (calls - misses) / calls if calls else 0.0)
+                for name, (calls, misses) in _stats.items()}
+
+
+def show_cache_stats(container=None):
+    """サイドバーなどに hit 率を表示する"""
+    container = container or st.sidebar
+    stats = cache_stats()
+    if not stats:
+        return
+    lines = [f"{name}: {hits}/{calls} hit ({rate:.0%})" for name, (calls, hits, rate) in sorted(stats.items())]
+    container.caption("キャッシュ　" + "　".join(lines))
@@ -0,0 +1,103 @@
+# 受入保留（Gale-Shapley）の記録と再生
+#
+# 段階シミュレーションはボタン 1 回で提案 1 回ずつ進めるが，状態を session_state の
+# リストに直接書き換えるので戻ることも途中へ飛ぶこともできなかった．ここでは好み 1 組に
+# つき受入保留を最後まで 1 回だけ走らせ，提案ごとの出来事（誰が誰に・受理か・振られた人）
+# を記録し，一定間隔で状態のスナップショットを取っておく．k 手目の状態は直前の
+# スナップショットから高々 interval 手を再生するだけで作れる．
+#
+# 進め方はアプリの gs_step と同じ: 相手のいない提案側を待ち行列で持ち，先頭の人が
+# まだ提案していない中で最も好きな相手に提案する．断られたら先頭のまま次の手で
+# 次の相手に提案し，受理されたら列から抜ける（振られた人は列の最後に並ぶ）．
+
+from bisect import bisect_left
+from collections import deque
+
+ACCEPT, REJECT = 1, 0
+
+
+class GSTrace:
+    """
+      trace = GSTrace(proposer_pref, receiver_rank)   # 番号で与える（smp_core.deferred_acceptance と同じ）
+      len(trace)              # 手数（最後の提案の後が終状態）
+      trace.events[k]         # k 手目 (0 始まり) の (提案側, 受け手, ACCEPT/REJECT, 振られた提案側 or -1)
+      trace.state(k)          # k 手打った後の GSState
+    """
+
+    def __init__(self, proposer_pref, receiver_rank, interval=8):
+        n = len(proposer_pref)
+        self.n = n
+        self.proposer_pref = [list(p) for p in proposer_pref]
+        self.interval = interval
+        self.events = []
+        self.snapshots = []          # interval 手ごとの (holder, nxt, free)
+        self._received = [[] for _ in range(n)]    # 受け手ごとの [(手, 提案側), ...]
+
+        holder = [-1] * n
+        nxt = [0] * n
+        free = deque(range(n))
+        while True:
+            if len(self.events) % interval == 0:
+                self.snapshots.append((tuple(holder), tuple(nxt), tuple(free)))
+            if not free:
+                break
+            i = free[0]
+            j = self.proposer_pref[i][nxt[i]]
+            nxt[i] += 1
+            self._received[j].append((len(self.events), i))
+            cur = holder[j]
+            if cur < 0 or receiver_rank[j][i] < receiver_rank[j][cur]:
+                holder[j] = i
+                free.popleft()
+                if cur >= 0:
+                    free.append(cur)
+                self.events.append((i, j, ACCEPT, cur))
+            else:
+                self.events.append((i, j, REJECT, -1))
+        self._received_steps = [[k for k, _ in r] for r in self._received]
+
+    def __len__(self):
+        return len(self.events)
+
+    def state(self, k):
+        """k 手目まで進めた状態．k は 0〜len(self) に切り詰める"""
+        k = max(0, min(k, len(self.events)))
+        base = k // self.interval
+        holder, nxt, free = self.snapshots[base]
+        holder, nxt, free = list(holder), list(nxt), deque(free)
+        for i, j, accepted, cur in self.events[base * self.interval:k]:
+            nxt[i] += 1
+            if accepted:
+                holder[j] = i
+                free.popleft()
+                if cur >= 0:
+                    free.append(cur)
+        received = [[i for _, i in r[:bisect_left(steps, k)]]
+                    for r, steps in zip(self._received, self._received_steps)]
+        last = self.events[k - 1] if k > 0 else None
+        return GSState(k, holder, nxt, list(free), received, last)
+
+
+class GSState:
+    """
+    step     : 何手打った後か
+    holder   : holder[j] = 受け手 j が今保留している提案側（いなければ -1）
+    nxt      : nxt[i] = 提案側 i がこれまでに提案した人数（好みの先頭から nxt[i] 人）
+    free     : 相手のいない提案側の待ち行列（先頭が次に提案する）
+    received : received[j] = 受け手 j に提案した人（提案順）
+    last     : 直前の手の出来事（0 手目は None）
+    """
+
+    __slots__ = ("step", "holder", "nxt", "free", "received", "last")
+
+    def __init__(self, step, holder, nxt, free, received, last):
+        self.step = step
+        self.holder = holder
+        self.nxt = nxt
+        self.free = free
+        self.received = received
+        self.last = last
+
+    @property
+    def done(self):
+        return not self.free
@@ -0,0 +1,244 @@
+# NumPy による総当たり（小さい n 向け）と受入保留（大きい n 向け）
+#
+# n <= 9 なら n! 通りの順列表を一度作ってキャッシュしておき，全順列の
+# ブロッキングペアの有無を順位行列のブロードキャストでまとめて判定する．
+# 生き残った安定マッチングの指標も同じ配列から一度に求める．
+# n が数千〜数万のときは，受入保留を「ラウンド」単位で配列演算にして解く．
+
+import itertools
+import math
+from functools import lru_cache
+
+import numpy as np
+
+MAX_N = 9
+CHUNK = 40320  # 8! 行ずつ判定して一時配列の大きさを抑える
+
+
+@lru_cache(maxsize=None)
+def permutation_table(n):
+    """
+    (perms, inverse) を返す．perms[k] は itertools.permutations(range(n)) の k 番目，
+    inverse[k] はその逆置換．どちらも書き込み不可の int8 配列．
+    """
+    if n > MAX_N:
+        raise ValueError(f"総当たりは n <= {MAX_N} まで (n = {n})")
+    perms = np.array(list(itertools.permutations(range(n))), dtype=np.int8).reshape(math.factorial(n), n)
+    inverse = np.argsort(perms, axis=1).astype(np.int8)
+    perms.flags.writeable = False
+    inverse.flags.writeable = False
+    return perms, inverse
+
+
+def _blocking_tensor(men_rank, women_rank, wives, husbands):
+    # (B, n, n) の真偽値: [b, i, j] が True なら (男性 i, 女性 j) はマッチング b のブロッキングペア
+    idx = np.arange(men_rank.shape[0])
+    own_m = men_rank[idx, wives]        # (B, n) 男性 i の今の相手の順位
+    own_w = women_rank[idx, husbands]   # (B, n) 女性 j の今の相手の順位
+    man_better = men_rank[None, :, :] < own_m[:, :, None]
+    # women_rank.T[i, j] = 女性 j にとっての男性 i の順位
+    woman_better = women_rank.T[None, :, :] < own_w[:, None, :]
+    return man_better & woman_better
+
+
+def stable_mask(men_rank, women_rank):
+    """全順列（男性 i の相手 = perms[k][i]）について安定かどうかの真偽値配列"""
+    men_rank = np.asarray(men_rank)
+    women_rank = np.asarray(women_rank)
+    perms, inverse = permutation_table(men_rank.shape[0])
+    mask = np.empty(len(perms), dtype=bool)
+    for start in range(0, len(perms), CHUNK):
+        blocking = _blocking_tensor(men_rank, women_rank, perms[start:start + CHUNK], inverse[start:start + CHUNK])
+        mask[start:start + CHUNK] = ~blocking.any(axis=(1, 2))
+    return mask
+
+
+def blocking_pairs_batch(profile, matchings):
+    """
+    複数のマッチングのブロッキングペアをまとめて求める．
+    matchings は (B, n) の配列（各行が wives）．(B, n, n) の真偽値配列を返し，
+    [b, i, j] が True なら (男性 i, 女性 j) がマッチング b のブロッキングペア．
+    np.argwhere(result[b]) で b 番目のペアの一覧が取れる．
+    """
+    wives = np.asarray(matchings, dtype=np.intp).reshape(-1, profile.n)
+    husbands = np.argsort(wives, axis=1)
+    _, _, men_rank, women_rank = profile.arrays()
+    return _blocking_tensor(men_rank, women_rank, wives, husbands)
+
+
+def brute_force_table(profile):
+    """
+    全安定マッチングと指標を一度に求める．(wives, table) を返す．
+      wives[k]  : k 番目の安定マッチング（男性 i の相手の番号）．並びは順列順
+      table[k]  : [不満度合計, 男性和, 女性和, 差, 最大]（calculate_dissatisfaction と同じ）
+    """
+    _, _, men_rank, women_rank = profile.arrays()
+    n = profile.n
+    perms, inverse = permutation_table(n)
+    mask = stable_mask(men_rank, women_rank)
+    wives = perms[mask].astype(np.intp)
+    husbands = inverse[mask].astype(np.intp)
+    idx = np.arange(n)
+    own_m = men_rank[idx, wives]
+    own_w = women_rank[idx, husbands]
+    ms = own_m.sum(axis=1)
+    ws = own_w.sum(axis=1)
+    worst = np.maximum(own_m.max(axis=1, initial=0), own_w.max(axis=1, initial=0))
+    table = np.stack([ms + ws, ms, ws, np.abs(ms - ws), worst], axis=1)
+    return wives, table
+
+
+def to_satisfaction(n, table):
+    """不満度の表を [満足度合計, 男性和, 女性和, 差, 最小] に変換する"""
+    top = n - 1
+    ms = top * n - table[:, 1]
+    ws = top * n - table[:, 2]
+    return np.stack([ms + ws, ms, ws, np.abs(ms - ws), top - table[:, 4]], axis=1)
+
+
+# -------------------- ラウンド単位の受入保留（大きい n 向け） -------------------- #
+def _rounds(pref, rank):
+    # (B, n, n) の好みと順位について全インスタンスをまとめて受入保留する．
+    # 提案側・受け手は「インスタンス番号 * n + 番号」の通し番号で扱う．
+    batch, n = pref.shape[:2]
+    size = batch * n
+    flat_pref = pref.reshape(size, n)
+    flat_rank = rank.reshape(size, n)
+    base = np.repeat(np.arange(batch, dtype=np.intp) * n, n)    # 通し番号 -> インスタンスの先頭
+    nxt = np.zeros(size, dtype=np.intp)
+    holder = np.full(size, -1, dtype=np.intp)
+    held_rank = np.full(size, n, dtype=np.intp)    # n は「まだ誰も保留していない」
+    rounds = np.zeros(batch, dtype=np.intp)
+    free = np.arange(size)
+    while free.size:
+        offset = base[free]
+        rounds += np.bincount(free // n, minlength=batch) > 0
+        targets = offset + flat_pref[free, nxt[free]]
+        nxt[free] += 1
+        ranks = flat_rank[targets, free - offset].astype(np.intp)
+        # 受け手ごと・順位の良い順に並べ，各受け手の先頭が今回の最良の提案
+        order = np.argsort(targets * n + ranks)
+        targets, ranks, free = targets[order], ranks[order], free[order]
+        best = np.empty(targets.size, dtype=bool)
+        best[0] = True
+        np.not_equal(targets[1:], targets[:-1], out=best[1:])
+        best_to, best_rank, best_from = targets[best], ranks[best], free[best]
+        win = best_rank < held_rank[best_to]
+        won = best_to[win]
+        displaced = holder[won]
+        holder[won] = best_from[win]
+        held_rank[won] = best_rank[win]
+        free = np.concatenate([free[~best], best_from[~win], displaced[displaced >= 0]])
+    partner = np.empty(size, dtype=np.intp)
+    partner[holder] = np.arange(size) - base
+    return partner.reshape(batch, n), rounds, nxt.reshape(batch, n).sum(axis=1)
+
+
+def deferred_acceptance_rounds(proposer_pref, receiver_rank):
+    """
+    受入保留を配列演算で行う．各ラウンドで相手のいない提案側が全員同時に次の相手へ
+    提案し，受け手ごとに（今保留している相手も含めて）最も順位の良い 1 人だけを残す．
+    引数は smp_core.deferred_acceptance と同じ（(n, n) の配列かリスト）．
+    (partner, rounds, proposals) を返す．partner[i] は提案側 i の相手の番号，
+    rounds はラウンド数，proposals は提案の総数．結果は 1 人ずつ提案する場合と同じ
+    （提案側最適の安定マッチング）．n = 10000 の一様ランダムな好みで 0.3 秒程度．
+    """
+    pref = np.asarray(proposer_pref)
+    rank = np.asarray(receiver_rank)
+    partner, rounds, proposals = _rounds(pref[None], rank[None])
+    return partner[0], int(rounds[0]), int(proposals[0])
+
+
+def stable_by_rounds(profile, women_propose=False):
+    """
+    PreferenceProfile について deferred_acceptance_rounds を行い
+    (wives, rounds, proposals) を返す．women_propose なら女性が提案する（女性最適）．
+    """
+    men_pref, women_pref, men_rank, women_rank = profile.arrays()
+    if women_propose:
+        husbands, rounds, proposals = deferred_acceptance_rounds(women_pref, men_rank)
+        return np.argsort(husbands), rounds, proposals
+    return deferred_acceptance_rounds(men_pref, women_rank)
+
+
+# -------------------- 多数のインスタンスをまとめて解く -------------------- #
+# 4×4 や 5×5 を何千個も解くときは，1 個ずつ Python の関数を呼ぶ手間が計算そのものより
+# 重い．好みを (インスタンス数, n, n) の配列に積み，受入保留・安定性判定・指標を
+# インスタンスの軸もまとめた配列演算で一度に行う．
+
+def profiles_to_arrays(profiles):
+    """
+    [(men_prefs, women_prefs), ...]（BEST_PREFS の値と同じ辞書の組）を
+    (men_pref, women_pref) の (B, n, n) 配列にする．番号は辞書の並び順．
+    """
+    men_pref, women_pref = [], []
+    for men_prefs, women_prefs in profiles:
+        man_index = {m: i for i, m in enumerate(men_prefs)}
+        woman_index = {w: j for j, w in enumerate(women_prefs)}
+        men_pref.append([[woman_index[w] for w in p] for p in men_prefs.values()])
+        women_pref.append([[man_index[m] for m in p] for p in women_prefs.values()])
+    return np.array(men_pref, dtype=np.intp), np.array(women_pref, dtype=np.intp)
+
+
+def ranks_batch(pref):
+    """(B, n, n) の好みから順位 rank[b, i, j] = インスタンス b の i にとっての j の順位"""
+    return np.argsort(pref, axis=2)
+
+
+def _husbands(wives):
+    return np.argsort(wives, axis=1)
+
+
+def stable_batch(men_rank, women_rank, wives):
+    """
+    (B, n, n) の順位と (B, n) のマッチング（各行が wives）について，
+    インスタンスごとに安定かどうかの (B,) 真偽値配列を返す．
+    """
+    wives = np.asarray(wives, dtype=np.intp)
+    husbands = _husbands(wives)
+    own_m = np.take_along_axis(men_rank, wives[:, :, None], axis=2)[:, :, 0]      # (B, n)
+    own_w = np.take_along_axis(women_rank, husbands[:, :, None], axis=2)[:, :, 0]
+    man_better = men_rank < own_m[:, :, None]
+    woman_better = women_rank.transpose(0, 2, 1) < own_w[:, None, :]
+    return ~(man_better & woman_better).any(axis=(1, 2))
+
+
+def satisfaction_batch(men_rank, women_rank, wives):
+    """(B, n) のマッチングの [満足度合計, 男性和, 女性和, 差, 最小] を (B, 5) で返す"""
+    wives = np.asarray(wives, dtype=np.intp)
+    n = wives.shape[1]
+    own_m = np.take_along_axis(men_rank, wives[:, :, None], axis=2)[:, :, 0]
+    own_w = np.take_along_axis(women_rank, _husbands(wives)[:, :, None], axis=2)[:, :, 0]
+    ms = own_m.sum(axis=1)
+    ws = own_w.sum(axis=1)
+    worst = np.maximum(own_m.max(axis=1, initial=0), own_w.max(axis=1, initial=0))
+    table = np.stack([ms + ws, ms, ws, np.abs(ms - ws), worst], axis=1)
+    return to_satisfaction(n, table)
+
+
+def solve_batch(men_pref, women_pref, matchings=None):
+    """
+    (B, n, n) の好み（profiles_to_arrays の形）をまとめて解き，配列の辞書を返す．
+      "man_optimal" / "woman_optimal"  : (B, n) 男性最適・女性最適の wives
+      "man_metrics" / "woman_metrics"  : (B, 5) それぞれの [満足度合計, 男性和, 女性和, 差, 最小]
+      "unique"                         : (B,) 安定マッチングが 1 つだけか（両者が一致）
+    matchings に (B, n) の wives を渡すと "stable" (B,) と "metrics" (B, 5) も加える．
+    """
+    men_pref = np.asarray(men_pref)
+    women_pref = np.asarray(women_pref)
+    men_rank = ranks_batch(men_pref)
+    women_rank = ranks_batch(women_pref)
+    man_optimal, _, _ = _rounds(men_pref, women_rank)
+    husbands, _, _ = _rounds(women_pref, men_rank)
+    woman_optimal = _husbands(husbands)
+    result = {
+        "man_optimal": man_optimal,
+        "woman_optimal": woman_optimal,
+        "man_metrics": satisfaction_batch(men_rank, women_rank, man_optimal),
+        "woman_metrics": satisfaction_batch(men_rank, women_rank, woman_optimal),
+        "unique": (man_optimal == woman_optimal).all(axis=1),
+    }
+    if matchings is not None:
+        result["stable"] = stable_batch(men_rank, women_rank, matchings)
+        result["metrics"] = satisfaction_batch(men_rank, women_rank, matchings)
+    return result
@@ -0,0 +1,460 @@
+# 総当たり（smp_vector.brute_force_table / stable_mask）との突き合わせ
+#
+# ローテーション・最小カット・分枝限定・標準形・全数調査・まとめて解く受入保留は
+# どれも総当たりを使わずに答えを出すので，n <= 5 のランダムな好みで総当たりと同じ
+# 答えになることを確かめる．
+#
+#   python -m pytest -q test_smp.py
+
+import os
+import pickle
+import random
+
+import numpy as np
+import pytest
+
+import census4
+from smp_cache import ResultCache
+from smp_canon import apply_relabelling, canonical_form
+from smp_core import Matching, PreferenceProfile
+from smp_large import LargeProfile
+from smp_solvers import egalitarian_matching, minimum_regret_matching, sex_equal_matching
+from smp_vector import (blocking_pairs_batch, brute_force_table, deferred_acceptance_rounds, permutation_table,
+                        solve_batch, stable_batch, stable_by_rounds, stable_mask, to_satisfaction)
+
+SIZES = (1, 2, 3, 4, 5)
+TRIALS = 150
+
+
+def random_prefs(rng, n):
+    men_pref = [rng.sample(range(n), n) for _ in range(n)]
+    women_pref = [rng.sample(range(n), n) for _ in range(n)]
+    return men_pref, women_pref
+
+
+def random_profiles(n, seed=0, trials=TRIALS):
+    rng = random.Random(seed * 100 + n)
+    for _ in range(trials):
+        yield PreferenceProfile.from_arrays(*random_prefs(rng, n))
+
+
+def relabel(rng, men_pref, women_pref):
+    # 男性・女性の番号をランダムに振り直し，半分の確率で男女も入れ替える
+    n = len(men_pref)
+    sm, sw = rng.sample(range(n), n), rng.sample(range(n), n)
+    new_men = [None] * n
+    new_women = [None] * n
+    for i, p in enumerate(men_pref):
+        new_men[sm[i]] = [sw[j] for j in p]
+    for j, p in enumerate(women_pref):
+        new_women[sw[j]] = [sm[i] for i in p]
+    swapped = rng.random() < 0.5
+    return (new_women, new_men, swapped) if swapped else (new_men, new_women, swapped)
+
+
+def sorted_rows(table):
+    return sorted(map(tuple, np.asarray(table).tolist()))
+
+
+# -------------------- 列挙・個数 -------------------- #
+@pytest.mark.parametrize("n", SIZES)
+def test_lattice_matches_brute_force(n):
+    for profile in random_profiles(n):
+        wives, table = brute_force_table(profile)
+        lattice = profile.lattice()
+        # 順列順と wives の辞書順は同じなので並びまで一致する
+        assert lattice.matchings == wives.tolist()
+        assert [profile.to_wives(m) for m in profile.all_stable_matchings()] == wives.tolist()
+        assert profile.count_stable_matchings() == (len(wives), 0)
+        assert lattice.satisfaction_table() == to_satisfaction(n, table).tolist()
+        poset = profile.rotations()
+        assert sorted(poset.iter_matchings()) == wives.tolist()
+        for ideal in poset.iter_ideals():
+            assert poset.ideal_of(poset.matching_of(ideal)) == ideal
+
+
+@pytest.mark.parametrize("n", SIZES)
+def test_stability_matches_stable_mask(n):
+    perms, _ = permutation_table(n)
+    rng = random.Random(n)
+    for profile in random_profiles(n, seed=1, trials=30):
+        _, _, men_rank, women_rank = profile.arrays()
+        mask = stable_mask(men_rank, women_rank)
+        for k in rng.sample(range(len(perms)), min(len(perms), 24)):
+            wives = perms[k].tolist()
+            assert profile.is_stable(wives) == mask[k]
+            assert (profile.find_blocking_pair(wives) is None) == mask[k]
+            assert (not profile.blocking_pairs(wives)) == mask[k]
+
+
+# -------------------- ソルバ -------------------- #
+@pytest.mark.parametrize("n", SIZES)
+def test_solvers_match_brute_force(n):
+    for profile in random_profiles(n, seed=2):
+        _, table = brute_force_table(profile)
+        wives = egalitarian_matching(profile)
+        assert profile.is_stable(wives)
+        assert profile.dissatisfaction(wives)[0] == table[:, 0].min()
+
+        wives, value = minimum_regret_matching(profile)
+        assert profile.is_stable(wives)
+        assert profile.dissatisfaction(wives)[4] == table[:, 4].min()
+        assert value == n - 1 - table[:, 4].min()
+
+        wives, diff, gap = sex_equal_matching(profile)
+        assert profile.is_stable(wives)
+        assert gap == 0
+        assert diff == profile.dissatisfaction(wives)[3] == table[:, 3].min()
+
+
+# -------------------- 標準形 -------------------- #
+@pytest.mark.parametrize("n", SIZES)
+def test_canonical_form_is_invariant(n):
+    rng = random.Random(n)
+    for profile in random_profiles(n, seed=3, trials=60):
+        men_pref, women_pref = profile.men_pref, profile.women_pref
+        form, digest, relabelling = canonical_form(men_pref, women_pref)
+        assert apply_relabelling(men_pref, women_pref, relabelling) == form
+        new_men, new_women, swapped = relabel(rng, men_pref, women_pref)
+        assert canonical_form(new_men, new_women)[:2] == (form, digest)
+
+        # 同型なパターンは指標の表も同じ（男女を入れ替えたら男性和と女性和も入れ替わる）
+        _, table = brute_force_table(profile)
+        _, other = brute_force_table(PreferenceProfile.from_arrays(new_men, new_women))
+        if swapped:
+            other = other[:, [0, 2, 1, 3, 4]]
+        assert sorted_rows(other) == sorted_rows(table)
+
+
+@pytest.mark.parametrize("n", (3, 6, 12))
+def test_canonical_form_with_identical_preferences(n):
+    # 全員が同じ好み（マスターリスト）でも付け替えで変わらず，すぐ終わる
+    rng = random.Random(n)
+    for _ in range(20):
+        master = rng.sample(range(n), n)
+        men_pref = [master] * n
+        women_pref = [rng.sample(range(n), n) if rng.random() < 0.5 else master for _ in range(n)]
+        form, digest, relabelling = canonical_form(men_pref, women_pref)
+        assert apply_relabelling(men_pref, women_pref, relabelling) == form
+        new_men, new_women, _ = relabel(rng, men_pref, women_pref)
+        assert canonical_form(new_men, new_women)[:2] == (form, digest)
+
+
+# -------------------- 全数調査 -------------------- #
+def test_census_lookup_matches_brute_force(tmp_path):
+    # R 1 つ分だけ調べたファイルを作り，その番地の代表を付け替えたもので引く
+    rows = census4._row_sets()
+    out = str(tmp_path / "census4")
+    path = out + ".u32"
+    np.memmap(path, dtype=np.uint32, mode="w+", shape=(len(rows), census4.COLS)).flush()
+    k = len(rows) // 2
+    census4._job((path, k))
+    census = census4.Census(out)
+    filled = np.flatnonzero(census.data[k])
+    assert filled.size
+
+    rng = random.Random(4)
+    men_pref = [census4.PERMS[r] for r in rows[k]]
+    for c in rng.sample(filled.tolist(), 200):
+        digits = [(c // int(w)) % census4.P for w in census4.WEIGHTS]
+        women_pref = [census4.PERMS[d] for d in digits]
+        new_men, new_women, _ = relabel(rng, men_pref, women_pref)
+        profile = PreferenceProfile.from_arrays(new_men, new_women)
+        _, table = brute_force_table(profile)
+        best = to_satisfaction(census4.N, table)
+        assert census.lookup(profile) == {
+            "count": len(table),
+            "total": best[:, 0].max(),
+            "men": best[:, 1].max(),
+            "women": best[:, 2].max(),
+            "diff": best[:, 3].min(),
+            "min": best[:, 4].max(),
+        }
+
+
+# -------------------- 受入保留（ラウンド・まとめて・記録） -------------------- #
+@pytest.mark.parametrize("n", SIZES)
+def test_batch_deferred_acceptance(n):
+    profiles = list(random_profiles(n, seed=5))
+    men_pref = np.array([p.men_pref for p in profiles]).reshape(-1, n, n)
+    women_pref = np.array([p.women_pref for p in profiles]).reshape(-1, n, n)
+    rng = np.random.default_rng(n)
+    matchings = np.array([rng.permutation(n) for _ in profiles])
+    result = solve_batch(men_pref, women_pref, matchings)
+
+    for b, profile in enumerate(profiles):
+        wives, table = brute_force_table(profile)
+        satisfaction = to_satisfaction(n, table)
+        # 男性最適は男性の順位和が（ただ 1 つ）最小の安定マッチング．女性最適も同様
+        best_m, best_w = table[:, 1].argmin(), table[:, 2].argmin()
+        man, woman = wives[best_m].tolist(), wives[best_w].tolist()
+        assert result["man_optimal"][b].tolist() == man == profile.man_optimal()
+        assert result["woman_optimal"][b].tolist() == woman == profile.woman_optimal()
+        assert result["man_metrics"][b].tolist() == satisfaction[best_m].tolist()
+        assert result["woman_metrics"][b].tolist() == satisfaction[best_w].tolist()
+        assert result["unique"][b] == (len(wives) == 1)
+        assert result["stable"][b] == profile.is_stable(matchings[b].tolist())
+        assert result["metrics"][b].tolist() == profile.satisfaction(matchings[b].tolist())
+
+        assert stable_by_rounds(profile)[0].tolist() == man
+        assert stable_by_rounds(profile, women_propose=True)[0].tolist() == woman
+        _, _, _, women_rank = profile.arrays()
+        assert deferred_acceptance_rounds(profile.men_pref, women_rank)[0].tolist() == man
+
+        # 記録の終状態: holder[受け手] = 提案側
+        trace = profile.gs_trace()
+        final = trace.state(len(trace))
+        assert final.done
+        assert [final.holder.index(i) for i in range(n)] == man
+        trace = profile.gs_trace(women_propose=True)
+        assert trace.state(len(trace)).holder == woman
+
+    men_rank = np.array([p.men_rank for p in profiles]).reshape(-1, n, n)
+    women_rank = np.array([p.women_rank for p in profiles]).reshape(-1, n, n)
+    assert stable_batch(men_rank, women_rank, result["man_optimal"]).all()
+    assert stable_batch(men_rank, women_rank, result["woman_optimal"]).all()
+
+
+# -------------------- Matching・PreferenceProfile -------------------- #
+@pytest.mark.parametrize("wives", [[-1, 0], [0, 2], [0, 0], [1, 1, 0]])
+def test_matching_rejects_invalid_wives(wives):
+    with pytest.raises(ValueError):
+        Matching(wives)
+
+
+def test_matching_is_a_value():
+    m = Matching([2, 0, 1])
+    assert [m.wife(i) for i in range(3)] == [2, 0, 1]
+    assert [m.husband(j) for j in range(3)] == [1, 2, 0]
+    assert list(m) == [(0, 2), (1, 0), (2, 1)]
+    assert m == Matching((2, 0, 1)) and hash(m) == hash(Matching([2, 0, 1]))
+    assert pickle.loads(pickle.dumps(m)) == m
+    with pytest.raises(AttributeError):
+        m.wives = None
+    with pytest.raises(ValueError):
+        m.wives[0] = 1
+
+
+def test_profile_is_immutable_and_hashable():
+    men_prefs = {"A": ["X", "Y"], "B": ["Y", "X"]}
+    women_prefs = {"X": ["B", "A"], "Y": ["A", "B"]}
+    p = PreferenceProfile(men_prefs, women_prefs)
+    q = PreferenceProfile(dict(men_prefs), dict(women_prefs))
+    assert p == q and hash(p) == hash(q) and {p: 1}[q] == 1
+    assert pickle.loads(pickle.dumps(p)) == p
+    with pytest.raises(AttributeError):
+        p.men_pref = ()
+    with pytest.raises(TypeError):
+        p.man_index["A"] = 1
+    with pytest.raises(TypeError):
+        p.woman_index["X"] = 1
+    assert p.man_index["A"] == 0 and p.woman_index["Y"] == 1
+
+
+def test_matching_at_profile_boundaries():
+    for profile in random_profiles(4, seed=6, trials=50):
+        lattice = profile.lattice()
+        for k, wives in enumerate(lattice.matchings):
+            m = profile.matching(wives)
+            assert profile.is_stable(m) and profile.find_blocking_pair(m) is None
+            assert lattice.index_of(m) == lattice.index_of(wives) == lattice.index_of(profile.to_pairs(wives)) == k
+        m = Matching([3, 2, 1, 0])
+        assert profile.blocking_pairs(m) == profile.blocking_pairs([3, 2, 1, 0])
+
+
+# -------------------- 結果のキャッシュ -------------------- #
+def test_result_cache_evicts_least_recently_used(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache.sqlite3"), max_bytes=3000)
+    for k in range(3):
+        cache.put(f"k{k}", "blob", bytes(900))
+    assert cache.get("k0", "blob") is not None        # k0 を使ったので次に消えるのは k1
+    cache.put("k3", "blob", bytes(900))
+    assert cache.get("k1", "blob") is None
+    assert all(cache.get(f"k{k}", "blob") is not None for k in (0, 2, 3))
+    assert (cache.hits, cache.misses) == (4, 1)
+    assert cache.size()[0] == 3
+
+
+def test_result_cache_closes_connections(tmp_path):
+    if not os.path.isdir("/proc/self/fd"):
+        pytest.skip("/proc がない")
+    cache = ResultCache(str(tmp_path / "cache.sqlite3"))
+    before = len(os.listdir("/proc/self/fd"))
+    for k in range(50):
+        cache.put(str(k), "x", k)
+        cache.get(str(k), "x")
+    assert len(os.listdir("/proc/self/fd")) <= before + 2
+
+
+@pytest.mark.parametrize("n", (3, 4, 5))
+def test_result_cache_analysis_of_relabelled_profiles(tmp_path, n):
+    # 付け替え・男女の入れ替えで同じ標準形になるパターンは 1 行を共有し，それぞれの番号で返す
+    cache = ResultCache(str(tmp_path / "cache.sqlite3"))
+    rng = random.Random(n)
+    for profile in random_profiles(n, seed=7, trials=30):
+        for men_pref, women_pref in ((profile.men_pref, profile.women_pref),
+                                     relabel(rng, profile.men_pref, profile.women_pref)[:2]):
+            other = PreferenceProfile.from_arrays(men_pref, women_pref)
+            lattice = other.lattice()
+            result = cache.analysis(other)
+            assert result["matchings"] == lattice.matchings
+            assert result["satisfaction"] == lattice.satisfaction_table()
+            assert result["hasse"] == sorted((k, low) for k, low, _ in lattice.hasse_edges())
+    assert cache.size()[0] <= 30 and cache.hits >= 30
+
+
+# -------------------- 大きな好み -------------------- #
+def test_large_profile_matches_preference_profile():
+    for profile in random_profiles(5, seed=8, trials=40):
+        lp = LargeProfile.from_profile(profile)
+        assert lp.to_profile() == PreferenceProfile.from_arrays(profile.men_pref, profile.women_pref)
+        assert lp.man_optimal()[0].tolist() == profile.man_optimal()
+        assert lp.woman_optimal()[0].tolist() == profile.woman_optimal()
+        for wives in permutation_table(5)[0][::7].tolist():
+            expected = profile.blocking_pairs(wives)
+            pairs = [(profile.men[i], profile.women[j]) for i, j in lp.blocking_pairs(wives).tolist()]
+            assert sorted(pairs) == sorted(expected)
+            assert lp.is_stable(wives) == profile.is_stable(wives)
+            assert len(lp.blocking_pairs(wives, limit=1)) == min(1, len(expected))
+
+
+def test_large_profile_save_load_and_rank_dir(tmp_path):
+    data = tmp_path / "data"
+    lp = LargeProfile.random(300, seed=1, path=str(data))
+    wives = lp.man_optimal()[0]
+    assert sorted(os.listdir(data)) == ["men_pref.npy", "women_pref.npy"]
+
+    # load は好みのディレクトリに書き込まない（順位表は既定でメモリ上）
+    opened = LargeProfile.load(str(data))
+    assert isinstance(opened.men_pref, np.memmap)
+    assert (opened.man_optimal()[0] == wives).all() and opened.is_stable(wives)
+    assert sorted(os.listdir(data)) == ["men_pref.npy", "women_pref.npy"]
+
+    # rank_dir を渡したときだけそこに順位表を残す
+    ranks = tmp_path / "ranks"
+    opened = LargeProfile.load(str(data), rank_dir=str(ranks))
+    assert (opened.woman_optimal()[0] == lp.woman_optimal()[0]).all()
+    assert os.listdir(ranks) == ["men_rank.npy"]
+
+    # save は作ってある順位表も書き，load はそれを読むだけ
+    saved = tmp_path / "saved"
+    opened.save(str(saved))
+    reopened = LargeProfile.load(str(saved), mmap=False)
+    assert sorted(os.listdir(saved)) == ["men_pref.npy", "men_rank.npy", "women_pref.npy"]
+    assert (reopened.men_rank == opened.men_rank).all()
+    assert (reopened.men_pref == lp.men_pref).all() and (reopened.women_pref == lp.women_pref).all()
+
+
+# -------------------- 個数の推定 -------------------- #
+def test_estimate_ideals_is_close_to_the_count():
+    # Knuth の推定は不偏なので，サンプルを増やせば総当たりの個数から標準誤差の数倍以内に入る
+    checked = 0
+    for profile in random_profiles(5, seed=9, trials=100):
+        wives, _ = brute_force_table(profile)
+        poset = profile.rotations()
+        estimate, error = poset.estimate_ideals(samples=4000, seed=0)
+        if len(poset) == 0:
+            assert (estimate, error) == (1, 0)
+            continue
+        assert abs(estimate - len(wives)) <= 5 * error + 1e-9
+        checked += 1
+        # メモの上限を超えたら推定に切り替わる（同じ seed なら同じ値）
+        assert poset.count_ideals(max_states=0) is None
+        assert profile.count_stable_matchings(max_states=0, samples=4000, seed=0) == (estimate, error)
+    assert checked
+
+
+# -------------------- ブロッキングペアの一覧 -------------------- #
+@pytest.mark.parametrize("n", (1, 3, 5))
+def test_blocking_pairs_batch_matches_profile(n):
+    perms, _ = permutation_table(n)
+    for profile in random_profiles(n, seed=10, trials=20):
+        _, _, men_rank, women_rank = profile.arrays()
+        result = blocking_pairs_batch(profile, perms)
+        assert result.shape == (len(perms), n, n)
+        assert (~result.any(axis=(1, 2)) == stable_mask(men_rank, women_rank)).all()
+        for wives, blocking in zip(perms.tolist(), result):
+            pairs = [(profile.men[i], profile.women[j]) for i, j in np.argwhere(blocking).tolist()]
+            assert pairs == sorted(profile.blocking_pairs(wives), key=lambda p: (profile.man_index[p[0]],
+                                                                                 profile.woman_index[p[1]]))
+
+
+# -------------------- 束の演算 -------------------- #
+@pytest.mark.parametrize("n", (3, 4, 5))
+def test_lattice_join_meet_and_covers(n):
+    for profile in random_profiles(n, seed=11, trials=60):
+        lattice = profile.lattice()
+        ms = lattice.matchings
+        size = len(ms)
+        # above[a][b]: a が b の真上にある（男性に有利で，a != b）
+        above = [[a != b and lattice.dominates(ms[a], ms[b]) for b in range(size)] for a in range(size)]
+        for a in range(size):
+            for b in range(size):
+                join = lattice.join(ms[a], ms[b])
+                meet = lattice.meet(ms[a], ms[b])
+                # 安定マッチングの束なので join / meet も安定で，最小上界・最大下界になる
+                j, m = lattice.index_of(join), lattice.index_of(meet)
+                uppers = [c for c in range(size) if (c == a or above[c][a]) and (c == b or above[c][b])]
+                lowers = [c for c in range(size) if (c == a or above[a][c]) and (c == b or above[b][c])]
+                assert j in uppers and all(c == j or above[c][j] for c in uppers)
+                assert m in lowers and all(c == m or above[m][c] for c in lowers)
+                expected = 0 if a == b else -1 if above[a][b] else 1 if above[b][a] else None
+                assert lattice.compare(ms[a], ms[b]) == expected
+
+        # 被覆関係: 間に何もない真上・真下．辺のローテーションを除去すると下の端になる
+        edges = set()
+        for a in range(size):
+            lower = {b for b in range(size) if above[a][b]
+                     and not any(above[a][c] and above[c][b] for c in range(size))}
+            assert {b for b, _ in lattice.lower_covers(a)} == lower
+            for b, r in lattice.lower_covers(a):
+                wives = list(ms[a])
+                lattice.poset.apply(wives, r)
+                assert wives == ms[b]
+                assert (a, r) in lattice.upper_covers(b)
+                edges.add((a, b, r))
+        assert sorted(edges) == sorted(lattice.hasse_edges())
+
+
+# -------------------- 受入保留の記録 -------------------- #
+def _old_gs_step(state, men_prefs, women_prefs):
+    # 記録を入れる前のアプリの gs_step（女性が提案，session_state の代わりに dict）
+    if not state["free_women"]:
+        return
+    w = state["free_women"][0]
+    for m in women_prefs[w]:
+        if m not in state["proposals"][w]:
+            state["proposals"][w].append(m)
+            state["received"][m].append(w)
+            if m not in state["engaged"]:
+                state["engaged"][m] = w
+                state["free_women"].pop(0)
+            else:
+                current_w = state["engaged"][m]
+                if men_prefs[m].index(w) < men_prefs[m].index(current_w):
+                    state["engaged"][m] = w
+                    state["free_women"].pop(0)
+                    state["free_women"].append(current_w)
+            break
+
+
+@pytest.mark.parametrize("n", (1, 3, 5))
+def test_gs_trace_replays_the_old_step_simulation(n):
+    for profile in random_profiles(n, seed=12, trials=40):
+        men_prefs, women_prefs = profile.to_dicts()
+        men, women = profile.men, profile.women
+        state = {"free_women": list(women), "engaged": {}, "proposals": {w: [] for w in women},
+                 "received": {m: [] for m in men}}
+        trace = profile.gs_trace(women_propose=True, interval=3)
+        for k in range(len(trace) + 2):
+            replay = trace.state(k)
+            assert replay.step == min(k, len(trace))
+            assert {men[i]: women[j] for i, j in enumerate(replay.holder) if j >= 0} == state["engaged"]
+            assert [women[j] for j in replay.free] == state["free_women"]
+            assert {w: list(women_prefs[w][:c]) for w, c in zip(women, replay.nxt)} == state["proposals"]
+            assert {m: [women[j] for j in r] for m, r in zip(men, replay.received)} == state["received"]
+            assert replay.done == (not state["free_women"])
+            _old_gs_step(state, men_prefs, women_prefs)
+        # 終状態は女性最適マッチング
+        assert [state["engaged"][m] for m in men] == [women[j] for j in trace.state(len(trace)).holder]
+        assert profile.to_wives([(m, state["engaged"][m]) for m in men]) == profile.woman_optimal()